@@ -21,6 +21,7 @@ class FileInfo:
     language: str
     is_important: bool = False
     priority: int = 0
+    has_main_guard: Optional[bool] = None  # Python files only; None if not checked
 
 
 @dataclass
@@ -300,15 +301,22 @@ class ProjectAnalyzer:
         relative_path = str(path.relative_to(self.root))
         size = path.stat().st_size
         
-        # Count lines
+        language = self._detect_language(path)
+
+        # Count lines; Python files are read whole anyway, so also note
+        # whether they have an `if __name__ == "__main__"` guard
         lines = 0
+        has_main_guard = None
         try:
             with open(path, 'rb') as f:
-                lines = sum(1 for _ in f)
+                if language == 'python':
+                    data = f.read()
+                    lines = data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+                    has_main_guard = b'__name__' in data and b'__main__' in data
+                else:
+                    lines = sum(1 for _ in f)
         except Exception:
             pass
-        
-        language = self._detect_language(path)
         is_important = path.name in self.important_files or any(
             important in relative_path for important in self.important_files
         )
@@ -337,9 +345,10 @@ class ProjectAnalyzer:
             if language in primary_languages[self.project_type]:
                 priority += 5
         
-        if 'test' in relative_path.lower():
+        relative_lower = relative_path.lower()
+        if 'test' in relative_lower:
             priority -= 2  # Tests are less important for context
-        if 'example' in relative_path.lower() or 'demo' in relative_path.lower():
+        if 'example' in relative_lower or 'demo' in relative_lower:
             priority -= 1
         
         return FileInfo(
@@ -349,7 +358,8 @@ class ProjectAnalyzer:
             lines=lines,
             language=language,
             is_important=is_important,
-            priority=priority
+            priority=priority,
+            has_main_guard=has_main_guard
         )
     
     def analyze(self) -> ProjectInfo:
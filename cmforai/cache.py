@@ -0,0 +1,191 @@
+"""
+On-disk caching of generated context between runs.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from . import __version__
+from .analyzer import ProjectInfo
+
+try:
+    import xxhash
+except ImportError:  # optional, only makes content hashing faster
+    xxhash = None
+
+
+def default_cache_dir() -> Path:
+    """Return the per-user cache directory (honours XDG_CACHE_HOME)."""
+    base = os.environ.get('XDG_CACHE_HOME')
+    return (Path(base) if base else Path.home() / '.cache') / 'cmforai'
+
+
+def _root_hash(root: Path) -> str:
+    """Short stable name for a project root."""
+    return hashlib.blake2b(str(root).encode(), digest_size=8).hexdigest()
+
+
+def content_digest(data: bytes) -> str:
+    """Hash file content, with xxh3 when available."""
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def _atomic_write(path: Path, write: Callable[[Any], None], mode: str = 'wb') -> None:
+    """Write a file via a temporary sibling and os.replace; errors are ignored."""
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if 'b' in mode:
+            with open(tmp_path, mode) as f:
+                write(f)
+        else:
+            with open(tmp_path, mode, encoding='utf-8', newline='') as f:
+                write(f)
+        os.replace(tmp_path, path)
+    except OSError:
+        # Caching is best-effort; never fail generation because of it
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+# (mtime_ns, ctime_ns, inode, size) of a file as seen by os.stat
+Stamp = Tuple[int, int, int, int]
+
+
+def file_stamp(path: Any) -> Stamp:
+    """Stat a file into the stamp the caches compare (OSError if missing)."""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_ctime_ns, st.st_ino, st.st_size)
+
+
+class OutputCache:
+    """Caches the generated markdown, one entry per project root.
+
+    An entry is reused only while its fingerprint matches: the tool
+    version, the generation config, the project-level metadata, and the
+    path, stat stamp and analysis results of every project file.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        """Initialize the cache in cache_dir (default: user cache dir)."""
+        self.cache_dir = cache_dir or default_cache_dir()
+
+    def fingerprint(self, project_info: ProjectInfo, config_data: Dict[str, Any]) -> str:
+        """Compute the fingerprint of a project and generation config."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(__version__.encode())
+        digest.update(json.dumps(config_data, sort_keys=True, default=str).encode())
+        digest.update(json.dumps([
+            str(project_info.root), project_info.project_type, project_info.python_version,
+            project_info.description, project_info.dependencies,
+        ], default=str).encode())
+        for file_info in project_info.files:
+            try:
+                stamp = file_stamp(file_info.path)
+            except OSError:
+                stamp = None
+            digest.update(
+                f"{file_info.relative_path}\0{file_info.size}\0{stamp}\0{file_info.lines}\0"
+                f"{file_info.language}\0{file_info.is_important}\0{file_info.priority}\n".encode()
+            )
+        return digest.hexdigest()
+
+    def load(self, project_info: ProjectInfo, fingerprint: str) -> Optional[str]:
+        """Return the cached markdown if it matches fingerprint."""
+        try:
+            with open(self._entry_path(project_info), 'r', encoding='utf-8', newline='') as f:
+                if f.readline().rstrip('\n') != fingerprint:
+                    return None
+                return f.read()
+        except (OSError, UnicodeDecodeError):
+            # Unreadable or corrupt: treat as a miss
+            return None
+
+    def store(self, project_info: ProjectInfo, fingerprint: str, markdown: str) -> None:
+        """Save markdown under fingerprint, replacing the previous entry."""
+        def write(f):
+            f.write(fingerprint + '\n')
+            f.write(markdown)
+        _atomic_write(self._entry_path(project_info), write, 'w')
+
+    def _entry_path(self, project_info: ProjectInfo) -> Path:
+        """Cache file for a project, named after a hash of its root."""
+        return self.cache_dir / f'{_root_hash(project_info.root)}.md'
+
+
+class FileCache:
+    """Persistent cache of rendered file blocks, one JSON file per project root.
+
+    Entries are keyed by relative path and hold the file's stamp, its
+    content digest, a caller-supplied render key, the rendered block and
+    whether the stamp can be trusted on its own. It can't when the file
+    was changed just before the run: another write within the timestamp
+    resolution would leave the stamp as it was. In that case, or when
+    the stamp moved but the size didn't, the content digest decides.
+    """
+
+    FORMAT = 2
+    # Files changed less than this long before the run get their content checked
+    SETTLE_NS = 2_000_000_000
+
+    def __init__(self, root: Path, cache_dir: Optional[Path] = None):
+        """Load the cache for the project at root (empty if none or invalid)."""
+        self.path = (cache_dir or default_cache_dir()) / f'{_root_hash(root)}.json'
+        self._entries: Dict[str, Tuple[Stamp, str, list, str, bool]] = {}
+        self._dirty = False
+        self._settled_before = time.time_ns() - self.SETTLE_NS
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data['format'] == self.FORMAT and data['version'] == __version__:
+                self._entries = {
+                    rel_path: (tuple(stamp), digest, render_key, block, settled is True)
+                    for rel_path, (stamp, digest, render_key, block, settled)
+                    in data['entries'].items()
+                }
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            # Missing, unreadable or corrupt: start empty
+            self._entries = {}
+
+    def get(self, rel_path: str, stamp: Stamp, render_key: Any,
+            digest: Callable[[], str]) -> Optional[str]:
+        """Return the cached block for a file, or None if it may be stale."""
+        entry = self._entries.get(rel_path)
+        if entry is None or entry[2] != list(render_key):
+            return None
+        if entry[0] == stamp and entry[4]:
+            return entry[3]
+        if entry[0][3] != stamp[3]:
+            return None
+        # Touched but possibly unchanged, or too recent to trust: compare contents
+        if digest() != entry[1]:
+            return None
+        self.put(rel_path, stamp, render_key, entry[1], entry[3])
+        return entry[3]
+
+    def put(self, rel_path: str, stamp: Stamp, render_key: Any, digest: str, block: str) -> None:
+        """Store the rendered block for a file."""
+        settled = max(stamp[0], stamp[1]) < self._settled_before
+        self._entries[rel_path] = (stamp, digest, list(render_key), block, settled)
+        self._dirty = True
+
+    def prune(self, keep: Iterable[str]) -> None:
+        """Drop entries for files that are no longer part of the project."""
+        keep = set(keep)
+        for rel_path in [p for p in self._entries if p not in keep]:
+            del self._entries[rel_path]
+            self._dirty = True
+
+    def save(self) -> None:
+        """Write the cache back to disk if anything changed."""
+        if self._dirty:
+            data = {'format': self.FORMAT, 'version': __version__, 'entries': self._entries}
+            _atomic_write(self.path, lambda f: json.dump(data, f), 'w')
+            self._dirty = False
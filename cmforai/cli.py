@@ -3,6 +3,8 @@ Command-line interface for CMforAI.
 """
 
 import argparse
+import os
+import shutil
 import sys
 from pathlib import Path
 from typing import Optional
@@ -143,6 +145,19 @@ Examples:
         help='Analyze only specified files (relative paths), but keep project metadata'
     )
 
+    parser.add_argument(
+        '--cache',
+        action='store_true',
+        help='Reuse the previous output if no project file or option changed, '
+             'and re-render only changed files otherwise'
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not read or write any on-disk cache (overrides --cache)'
+    )
+
     parser.add_argument(
         '--gitlogs', 
         type=int, 
@@ -217,6 +232,12 @@ def main():
         gen_config.files_to_analyze = args.files
     if args.gitlogs:
         gen_config.gitlogs = args.gitlogs
+    if args.cache:
+        gen_config.cache_output = True
+        gen_config.use_file_cache = True
+    if args.no_cache:
+        gen_config.cache_output = False
+        gen_config.use_file_cache = False
 
     # Merge ignore patterns and important files
     ignore_patterns = app_config.custom_ignore_patterns + args.ignore
@@ -238,17 +259,31 @@ def main():
         # Generate markdown
         print("Generating markdown context...", file=sys.stderr)
         generator = MarkdownGenerator(gen_config)
-        markdown = generator.generate(project_info)
 
         # Output
         if args.output:
             output_path = Path(args.output)
             output_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(markdown)
+            # Generate into a sibling file and swap it in, so a failed run
+            # leaves the previous output untouched
+            tmp_path = output_path.with_name(f'.{output_path.name}.{os.getpid()}.tmp')
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    generator.generate_to(project_info, f)
+                if output_path.exists():
+                    # Keep the permissions of the file being replaced
+                    shutil.copymode(output_path, tmp_path)
+                os.replace(tmp_path, output_path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
             print(f"Context saved to: {output_path}", file=sys.stderr)
         else:
-            print(markdown)
+            generator.generate_to(project_info, sys.stdout)
+            sys.stdout.write("\n")
 
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
@@ -2,14 +2,464 @@
 Markdown generator module for creating formatted context from project analysis.
 """
 
+import functools
+import io
 import re
-from typing import List, Optional, Dict
+from bisect import bisect_right
+from collections import Counter, defaultdict, deque
+from itertools import accumulate, islice
+from operator import attrgetter
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+import weakref
+from typing import Any, List, Optional, Dict, Callable, Iterable, Iterator, TextIO, Tuple
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, replace
 import sys
+import signal
 import subprocess
+import threading
 import os
 from .analyzer import ProjectInfo, FileInfo
+from .cache import FileCache, OutputCache, Stamp, content_digest, file_stamp
+
+try:
+    import tiktoken
+except ImportError:  # optional, only makes --max-tokens budgets exact
+    tiktoken = None
+
+
+# Python source as tokens to keep (runs of plain code, string literals, a
+# stray quote) or a `#` comment, the only match that leaves group 1 empty.
+# String prefixes need no handling: their letters are plain code either way.
+_PY_COMMENT_RE = re.compile(
+    r'([^"' r"'#]+"
+    r'|"""[^"]*(?:"(?!"")[^"]*)*"""' r"|'''[^']*(?:'(?!'')[^']*)*'''"
+    r'|"[^"\\\n]*(?:\\.[^"\\\n]*)*"' r"|'[^'\\\n]*(?:\\.[^'\\\n]*)*'"
+    r'|["' r"'])"
+    r'|#[^\n]*'
+)
+
+# Shell quoting (never past the end of a line, so a stray apostrophe in a
+# heredoc can't swallow the rest of the file), escapes, `$#`/`${#var}` and
+# shebang lines (kept) or a `#` comment (dropped, together with its
+# indentation when it is alone on the line)
+_SH_COMMENT_RE = re.compile(
+    r'(?P<string>"(?:\\.|[^"\\\n])*"' r"|'[^'\n]*'"
+    r'|\\.|\$\{?#|^[ \t]*#![^\n]*)'
+    r'|^[ \t]+#[^\n]*|#[^\n]*',
+    re.MULTILINE,
+)
+
+# Ruby string literals (an unterminated one runs to end of line) or a `#` comment
+_RUBY_COMMENT_RE = re.compile(
+    r'(?P<string>"(?:\\.|[^"\\\n])*"?' r"|'(?:\\.|[^'\\\n])*'?)"
+    r'|#[^\n]*'
+)
+
+# C-family string/char literals and Go raw strings (kept) or // and /* */ comments
+# (dropped); an unterminated block comment runs to the end of the file. A char
+# literal holds one character or one escape, so Rust lifetimes ('a) and C++
+# digit separators (1'000) are never read as the start of a quoted run.
+_CSTYLE_COMMENT_RE = re.compile(
+    r'(?P<string>"(?:\\.|[^"\\\n])*"' r"|'(?:\\.[^'\n]*|[^'\\\n])'" r'|`[^`]*`)'
+    r'|/\*[\s\S]*?(?:\*/|\Z)|[ \t]*//[^\n]*'
+)
+
+# `#` or `//` up to end of line, with the whitespace before it (no string awareness)
+_GENERIC_COMMENT_RE = re.compile(r'[ \t]*(?:#|//)[^\n]*')
+
+# Characters that can change the // scanner's state: escapes, slashes, quotes
+_JS_SPECIAL_RE = re.compile(r'[\\/"\'`]')
+# Characters that open or close a JavaScript string or template literal
+_JS_QUOTES = frozenset('"\'`')
+
+
+def _keep_strings(match: 're.Match') -> str:
+    """Regex substitution callback: keep string tokens, drop comments."""
+    return match.group(0) if match.lastgroup == 'string' else ''
+
+
+def _remove_python_comments(content: str) -> str:
+    """Remove Python comments, leaving string literals intact."""
+    # findall gives group 1 for every kept token and '' for each comment
+    return ''.join(_PY_COMMENT_RE.findall(content))
+
+
+def _remove_js_comments(content: str) -> str:
+    """Remove JavaScript/TypeScript comments."""
+    lines = content.split('\n')
+    cleaned = []
+    in_multiline = False
+
+    for line in lines:
+        head, opener, tail = line.partition('/*')
+        if opener:
+            in_multiline = True
+            # Check if it closes on same line
+            _, closer, rest = tail.partition('*/')
+            if closer:
+                line = head + rest
+                in_multiline = False
+            else:
+                line = head
+
+        if in_multiline:
+            _, closer, rest = line.partition('*/')
+            if closer:
+                line = rest
+                in_multiline = False
+            else:
+                line = ''
+
+        # Remove single-line comments
+        if '//' in line:
+            # Check if // is in a string
+            quote_char = None
+            cut = -1
+            pos = 0
+            while True:
+                # Jump straight to the next character that can change state
+                match = _JS_SPECIAL_RE.search(line, pos)
+                if match is None:
+                    break
+                i = match.start()
+                char = line[i]
+                if char == '\\':
+                    # Escaped character: consume it together with the backslash
+                    pos = i + 2
+                    continue
+                if char in _JS_QUOTES:
+                    if quote_char is None:
+                        quote_char = char
+                    elif char == quote_char:
+                        quote_char = None
+                elif quote_char is None and line.startswith('//', i):
+                    cut = i
+                    break
+                pos = i + 1
+            if cut >= 0:
+                line = line[:cut]
+
+        if line or not in_multiline:
+            cleaned.append(line)
+
+    return '\n'.join(cleaned)
+
+
+# Comment stripper per language, together with the markers that must occur
+# in a file for there to be anything to strip
+_HASH_MARKERS = ('#',)
+_CSTYLE_MARKERS = ('//', '/*')
+_strip_cstyle = functools.partial(_CSTYLE_COMMENT_RE.sub, _keep_strings)
+_COMMENT_STRIPPERS: Dict[str, Tuple[Callable[[str], str], Tuple[str, ...]]] = {
+    'python': (_remove_python_comments, _HASH_MARKERS),
+    'ruby': (functools.partial(_RUBY_COMMENT_RE.sub, _keep_strings), _HASH_MARKERS),
+    'shell': (functools.partial(_SH_COMMENT_RE.sub, _keep_strings), _HASH_MARKERS),
+    'javascript': (_remove_js_comments, _CSTYLE_MARKERS),
+    'typescript': (_remove_js_comments, _CSTYLE_MARKERS),
+    'java': (_strip_cstyle, _CSTYLE_MARKERS),
+    'c': (_strip_cstyle, _CSTYLE_MARKERS),
+    'cpp': (_strip_cstyle, _CSTYLE_MARKERS),
+    'csharp': (_strip_cstyle, _CSTYLE_MARKERS),
+    'go': (_strip_cstyle, _CSTYLE_MARKERS),
+    'rust': (_strip_cstyle, _CSTYLE_MARKERS),
+}
+# Unknown languages fall back to generic # and // removal
+_GENERIC_STRIPPER = (functools.partial(_GENERIC_COMMENT_RE.sub, _keep_strings), ('#', '//'))
+
+
+@functools.lru_cache(maxsize=256)
+def _remove_comments(content: str, language: str) -> str:
+    """Remove comments from code based on language.
+
+    Memoized on the file content, so duplicate files (vendored copies,
+    boilerplate) are only stripped once. The cache is bounded to 256
+    entries.
+    """
+    stripper, markers = _COMMENT_STRIPPERS.get(language, _GENERIC_STRIPPER)
+    # No comment markers anywhere: nothing to strip
+    if not any(marker in content for marker in markers):
+        return content
+    return stripper(content)
+
+
+# Patterns used to describe a file from its first lines
+_DOCSTRING_RE = re.compile(r'"""(.*?)"""', re.DOTALL)
+_CLASS_RE = re.compile(r'class\s+(\w+)')
+_DEF_RE = re.compile(r'def\s+(\w+)')
+
+
+# Path keywords per theme, in priority order. The lookahead reports every
+# keyword occurrence (overlapping ones included) so the highest-priority
+# theme can be chosen, not just the leftmost keyword.
+_THEME_RE = re.compile(
+    r'(?=(?P<authentication>auth|login|jwt)'
+    r'|(?P<api>api|route)'
+    r'|(?P<database>db|database|model|schema)'
+    r'|(?P<websocket>websocket|ws)'
+    r'|(?P<chat>chat|message)'
+    r'|(?P<utils>util|helper|common)'
+    r'|(?P<tests>test))'
+)
+_THEME_RANK = {name: rank for rank, name in enumerate(
+    ('authentication', 'api', 'database', 'websocket', 'chat', 'utils', 'tests'))}
+
+
+def _read_text(path: str) -> str:
+    """Read a whole file as UTF-8 text, with the same result as open(..., 'r').
+
+    Uses raw os.read calls and a single decode instead of a buffered text
+    wrapper; newlines are normalised the way text mode would.
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        # Sized so a whole file normally arrives in one read
+        chunk_size = max(os.fstat(fd).st_size + 1, 65536)
+        chunks = []
+        while True:
+            chunk = os.read(fd, chunk_size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+
+    text = b''.join(chunks).decode('utf-8', errors='ignore')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+@functools.lru_cache(maxsize=4096)
+def _describe_file_head(content: str) -> str:
+    """Describe a file from its first 1000 characters."""
+    # Look for docstrings or comments
+    if '"""' in content or "'''" in content:
+        # Try to extract docstring
+        docstring_match = _DOCSTRING_RE.search(content)
+        if docstring_match:
+            doc = docstring_match.group(1).strip()
+            if len(doc) < 200:
+                return doc.split('\n')[0]
+
+    # Look for class/function names
+    if 'class ' in content:
+        class_match = _CLASS_RE.search(content)
+        if class_match:
+            return f"Class: {class_match.group(1)}"
+
+    if 'def ' in content:
+        func_match = _DEF_RE.search(content)
+        if func_match:
+            return f"Function: {func_match.group(1)}"
+
+    return ""
+
+
+# Whole lines that start (after indentation) with an import or a definition
+_PY_IMPORT_LINE_RE = re.compile(r'^[^\S\n]*(?:import |from )[^\n]*', re.MULTILINE)
+_PY_DEF_LINE_RE = re.compile(r'^([^\S\n]*)(?:class |def |async def )[^\n]*', re.MULTILINE)
+
+# Definition lines for the other structure-extracting compressors
+_JS_DEF_RE = re.compile(r'^\s*(export\s+)?(async\s+)?(function|class|const|let|var)\s+\w+')
+_JAVA_TYPE_RE = re.compile(r'^\s*(public|private|protected)?\s*(static)?\s*(class|interface|enum|@?\w+\s+(class|interface))')
+_JAVA_METHOD_RE = re.compile(r'^\s*(public|private|protected)?\s*(static)?\s*\w+\s+\w+\s*\(')
+_GO_DEF_RE = re.compile(r'^\s*(func|type|const|var)\s+\w+')
+_RUST_DEF_RE = re.compile(r'^\s*(pub\s+)?(fn|struct|enum|trait|impl|mod|const|static)\s+\w+')
+
+
+@functools.lru_cache(maxsize=None)
+def _token_encoding() -> Any:
+    """Return the tiktoken encoding used for token budgets, or None.
+
+    Only called when a token budget is set: on first use tiktoken may have
+    to download the encoding data, which can block without a network.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception:
+        # The encoding data may be missing and not downloadable
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _importance_stars(priority: int, is_important: bool) -> str:
+    """Map a file's priority and importance flag to its star rating."""
+    if priority >= 15:
+        return "⭐⭐⭐"
+    elif priority >= 10:
+        return "⭐⭐"
+    elif is_important:
+        return "⭐"
+    else:
+        return "⬜"
+
+
+def _partition_by_importance(files: List[FileInfo]) -> Tuple[List[FileInfo], List[FileInfo]]:
+    """Split files into (important, regular) in one pass, keeping their order."""
+    important: List[FileInfo] = []
+    regular: List[FileInfo] = []
+    for f in files:
+        (important if f.is_important else regular).append(f)
+    return important, regular
+
+
+# What running git and decoding its output can raise
+_GIT_ERRORS = (subprocess.SubprocessError, OSError, UnicodeDecodeError)
+
+
+def _kill_process_group(proc: subprocess.Popen) -> None:
+    """Kill a child started with start_new_session, and whatever it spawned.
+
+    Killing only the child would leave grandchildren holding its stdout
+    open, so a reader would still block.
+    """
+    if proc.returncode is not None:
+        return
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass  # Already gone
+
+
+def _collect_commit_log(lines: Iterable[str], hashes: List[str], limit: int,
+                        details: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Split streamed `git log` output into each commit's text, keyed by hash.
+
+    Every commit starts with a `commit <hash>` line at column 0; message,
+    stat and diff lines are all indented or prefixed, so they can't be
+    mistaken for one. Of each commit only enough is kept to give its first
+    limit characters after stripping, and reading stops once the last
+    commit has that much.
+
+    Commits are added to details (a new dict by default) as soon as the
+    next one starts, so if reading fails the completed ones are kept.
+    """
+    if details is None:
+        details = {}
+    pending = iter(hashes)
+    next_hash = next(pending, None)
+    current: Optional[str] = None
+    parts: List[str] = []
+    size = 0
+    full = False
+    for line in lines:
+        if next_hash is not None and line.startswith(f"commit {next_hash}"):
+            if current is not None:
+                details[current] = "".join(parts)
+            current, parts, size, full = next_hash, [], 0, False
+            next_hash = next(pending, None)
+        elif current is None or full:
+            continue
+
+        parts.append(line)
+        size += len(line)
+        if size > limit:
+            # Full once the text without trailing whitespace is past the limit
+            content = line.rstrip()
+            if content and size - (len(line) - len(content)) > limit:
+                full = True
+                if next_hash is None:
+                    break
+
+    if current is not None:
+        details[current] = "".join(parts)
+    return details
+
+
+def _render_file_block(file_info: FileInfo, include_comments: bool,
+                       read: Callable[[FileInfo], str]) -> str:
+    """Render the markdown block for one file, reading it with read()."""
+    try:
+        content: Optional[str] = read(file_info)
+        error = None
+    except Exception as e:
+        content, error = None, e
+
+    # File header with improved importance system
+    importance_stars = _importance_stars(file_info.priority, file_info.is_important)
+    lines = [
+        f"#### {importance_stars} File: `{file_info.relative_path}`",
+        f"*Language: {file_info.language} | Lines: {file_info.lines} | Size: {file_info.size} bytes*",
+    ]
+
+    # Add context for important files
+    if content is not None and file_info.is_important and file_info.lines > 50:
+        context = _describe_file_head(content[:1000])
+        if context:
+            lines.append(f"*Purpose: {context}*")
+
+    lines.append("")
+
+    if content is None:
+        lines.append(f"*Error reading file: {str(error)}*")
+        return "\n".join(lines)
+
+    try:
+        # Always include full file content - no compression or truncation
+        # Remove comments if requested
+        if not include_comments:
+            content = _remove_comments(content, file_info.language)
+
+        # Add code block
+        lang_tag = file_info.language if file_info.language != 'unknown' else ''
+        lines.append(f"```{lang_tag}")
+        lines.append(content)
+        lines.append("```")
+
+    except Exception as e:
+        lines.append(f"*Error reading file: {str(e)}*")
+
+    return "\n".join(lines)
+
+
+def _render_file_from_disk(file_info: FileInfo, include_comments: bool) -> Tuple[str, Optional[str]]:
+    """Process-pool worker: render a file and digest its content."""
+    content: Optional[str] = None
+
+    def read(f: FileInfo) -> str:
+        nonlocal content
+        content = _read_text(str(f.path))
+        return content
+
+    block = _render_file_block(file_info, include_comments, read)
+    digest = None
+    if content is not None:
+        digest = content_digest(content.encode('utf-8', 'surrogatepass'))
+    return block, digest
+
+
+def _render_chunk_from_disk(files: List[FileInfo],
+                            include_comments: bool) -> List[Tuple[str, Optional[str]]]:
+    """Process-pool worker: render a run of files, saving a round trip per file."""
+    return [_render_file_from_disk(f, include_comments) for f in files]
+
+
+def _map_in_order(pool: Executor, fn: Callable[[Any], Any], items: Iterable[Any],
+                  window: int) -> Iterator[Any]:
+    """Like pool.map, but with at most window calls submitted and not yet consumed.
+
+    Executor.map submits every call up front, so its finished futures hold
+    all results until they are read; here a slow consumer holds back the
+    submitting instead.
+    """
+    pending: 'deque[Future]' = deque()
+    try:
+        for item in items:
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            pending.append(pool.submit(fn, item))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Abandoned early (or failed): don't run what nobody will read
+        for future in pending:
+            future.cancel()
 
 
 @dataclass
@@ -29,86 +479,287 @@ class GenerationConfig:
     file_separator: str = "\n\n---\n\n"
     files_to_analyze: Optional[List[str]] = None
     gitlogs: Optional[int] = None
+    cache_output: bool = False  # Reuse output from the on-disk cache when nothing changed
+    use_file_cache: bool = False  # Reuse rendered file blocks from the on-disk cache
+
+
+@dataclass
+class _ProjectSignals:
+    """Path-derived facts gathered in a single pass over the project files."""
+    has_fastapi_or_main: bool = False
+    has_websocket: bool = False
+    has_django: bool = False
+    has_flask: bool = False
+    has_manage_py: bool = False
+    has_test: bool = False
+    named_entry_point: Optional[FileInfo] = None
+    dirs_lower: str = ""
+
+
+@dataclass(frozen=True)
+class _StructureSpec:
+    """How to pull imports and definitions out of one language's source."""
+    header: str
+    imports_heading: str
+    import_prefixes: Tuple[str, ...]
+    definitions: Tuple[Any, ...]  # compiled regexes, matched on stripped lines
+    doc_prefixes: Tuple[str, ...]  # lines after a definition that don't end its preview
+    import_infix: Optional[str] = None  # also an import if the line contains this
+    import_blocks: bool = False  # Go-style `import (...)` blocks
+
+
+_JS_STRUCTURE = _StructureSpec(
+    header="# File structure and key components (javascript):\n",
+    imports_heading="## Imports/Exports:",
+    import_prefixes=('import ', 'export ', 'require('),
+    import_infix='from ',
+    definitions=(_JS_DEF_RE,),
+    doc_prefixes=('//', '/*', '*'),
+)
+
+_STRUCTURE_SPECS: Dict[str, _StructureSpec] = {
+    'javascript': _JS_STRUCTURE,
+    'typescript': replace(_JS_STRUCTURE, header="# File structure and key components (typescript):\n"),
+    'java': _StructureSpec(
+        header="# File structure and key components (Java):\n",
+        imports_heading="## Imports:",
+        import_prefixes=('import ',),
+        definitions=(_JAVA_TYPE_RE, _JAVA_METHOD_RE),
+        doc_prefixes=('//', '/*', '*'),
+    ),
+    'go': _StructureSpec(
+        header="// File structure and key components (Go):\n",
+        imports_heading="## Imports:",
+        import_prefixes=('import ',),
+        import_blocks=True,
+        definitions=(_GO_DEF_RE,),
+        doc_prefixes=('//',),
+    ),
+    'rust': _StructureSpec(
+        header="// File structure and key components (Rust):\n",
+        imports_heading="## Imports/Modules:",
+        import_prefixes=('use ', 'mod '),
+        definitions=(_RUST_DEF_RE,),
+        doc_prefixes=('//',),
+    ),
+}
 
 
 class MarkdownGenerator:
-    """Generates markdown formatted context from project information."""
+    """Generates markdown formatted context from project information.
+
+    A ProjectInfo is treated as read-only once passed in: the header,
+    metadata and structure sections are cached per ProjectInfo object, so
+    changes made to one between calls are not seen. Analyze the project
+    again (or pass a copy) to pick them up.
+    """
 
     # Approximate tokens per character (rough estimate)
     TOKENS_PER_CHAR = 0.25
 
+    # Characters of each commit's `git show` output kept in the git log section
+    GIT_DIFF_PREVIEW_CHARS = 2000
+    # Seconds allowed for reading all commit details: a base plus a per-commit share
+    GIT_DETAILS_TIMEOUT = 10
+    GIT_DETAILS_TIMEOUT_PER_COMMIT = 15
+
+    # Heading icons for the thematic component groups
+    THEME_ICONS = {
+        'authentication': '🔐',
+        'api': '🌐',
+        'database': '💾',
+        'websocket': '🔌',
+        'chat': '💬',
+        'config': '⚙️',
+        'utils': '🛠️',
+        'tests': '🧪',
+        'main': '🚀',
+    }
+
+    # Below this many files rendering stays in threads; process pool startup
+    # costs more than it saves on small projects
+    PARALLEL_RENDER_MIN_FILES = 64
+    # Files sent to a worker process at a time
+    PROCESS_RENDER_CHUNK = 16
+    # Renders (chunks, for processes) submitted ahead of the writer, per
+    # worker: enough to keep workers busy without holding the whole document
+    RENDER_WINDOW_PER_WORKER = 2
+
+    # Regular files are tokenized in batches of this many, doubling each
+    # time, until the token budget is used up
+    TOKEN_COUNT_CHUNK = 16
+
+    # Header with instructions for LLM, filled in via str.format_map
+    HEADER_TEMPLATE = """# Project Context: {name}
+
+This document contains the complete context of the {label} project located at `{root}`.
+
+**Instructions for LLM:**
+- This is a complete codebase context for analysis, modification, or understanding
+- Files are organized by their directory structure
+- Important files are marked and prioritized
+- Use this context to understand the project architecture, dependencies, and implementation details
+- When referencing files, use the relative paths provided
+- Project type: {type}
+
+---
+"""
+
     def __init__(self, config: Optional[GenerationConfig] = None):
         """Initialize the generator with configuration."""
         self.config = config or GenerationConfig()
-
-    def generate(self, project_info: ProjectInfo) -> str:
-        """Generate markdown context from project information."""
-        parts = []
+        # Sections that depend only on ProjectInfo, keyed by id(project_info);
+        # not invalidated if a caller mutates that object between runs
+        self._section_cache: Dict[int, Dict[str, Any]] = {}
+        # File contents read during the current generate() call, by path
+        self._content_cache: Dict[str, str] = {}
+        # Exact token counts (when tiktoken is available), by path
+        self._token_counts: Dict[str, int] = {}
+        # Persistent rendered-block cache, open only while generating
+        self._file_cache: Optional[FileCache] = None
+
+    def _build_pipeline(self) -> List[Callable[[ProjectInfo], Optional[str]]]:
+        """Resolve the config flags into the ordered list of section builders.
+
+        Built at the start of every run, so the flags are read once per
+        document and later config changes apply like they do to the other
+        sections. The file contents and git history sections are streamed
+        separately after these.
+        """
+        pipeline: List[Callable[[ProjectInfo], Optional[str]]] = []
 
         # Header with instructions
         if self.config.add_instructions:
-            parts.append(self._generate_header(project_info))
+            pipeline.append(functools.partial(self._cached_section, 'header', builder=self._generate_header))
 
         # Architecture overview (new - Level 1)
-        parts.append(self._generate_architecture_overview(project_info))
+        pipeline.append(self._generate_architecture_overview)
 
         # Project roadmap (new - key components map)
-        parts.append(self._generate_project_roadmap(project_info))
+        pipeline.append(self._generate_project_roadmap)
 
         # Metadata section
         if self.config.include_metadata:
-            parts.append(self._generate_metadata(project_info))
+            pipeline.append(functools.partial(self._cached_section, 'metadata', builder=self._generate_metadata))
 
-        # Dependencies
-        if self.config.include_dependencies and project_info.dependencies:
-            parts.append(self._generate_dependencies(project_info))
+        # Dependencies (skipped for projects without any)
+        if self.config.include_dependencies:
+            pipeline.append(self._generate_dependencies_if_any)
 
         # Project structure
         if self.config.include_structure:
-            parts.append(self._generate_structure(project_info))
-        
-        git_logs_section = ""
-        if self.config.gitlogs:
-            git_logs_section = self._generate_git_logs(project_info.root)
+            pipeline.append(functools.partial(self._cached_section, 'structure', builder=self._generate_structure))
 
         # Thematic grouping of components (new - Level 2)
-        parts.append(self._generate_thematic_components(project_info))
+        pipeline.append(self._generate_thematic_components)
+
+        return pipeline
+
+    def _read_file(self, file_info: FileInfo) -> str:
+        """Read a file's text, at most once per generate() call."""
+        key = str(file_info.path)
+        content = self._content_cache.get(key)
+        if content is None:
+            content = self._content_cache[key] = _read_text(key)
+        return content
+
+    def _cached_section(self, name: str, project_info: ProjectInfo,
+                        builder: Callable[[ProjectInfo], Any]) -> Any:
+        """Return a ProjectInfo-only section, building it on first use.
+
+        Keyed by object identity, not content: the section is never rebuilt
+        for the same ProjectInfo, even if it was modified since.
+        """
+        key = id(project_info)
+        sections = self._section_cache.get(key)
+        if sections is None:
+            sections = self._section_cache[key] = {}
+            # Drop cached sections once the ProjectInfo is garbage-collected
+            weakref.finalize(project_info, self._section_cache.pop, key, None)
+        if name not in sections:
+            sections[name] = builder(project_info)
+        return sections[name]
 
-        # File contents (Level 3 - detailed)
-        files_content = self._generate_files_content(project_info)
-        parts.append(files_content)
-
-        final_content = "\n\n".join(parts)
-
-        if git_logs_section:
-            final_content = final_content + "\n\n" + git_logs_section
-
-        return final_content
+    def generate(self, project_info: ProjectInfo) -> str:
+        """Generate markdown context from project information."""
+        buf = io.StringIO()
+        self.generate_to(project_info, buf)
+        return buf.getvalue()
+
+    def generate_to(self, project_info: ProjectInfo, out: TextIO) -> None:
+        """Write markdown context to a text stream as it is generated."""
+        # Git history changes without touching project files, so it can't
+        # be fingerprinted by file metadata; such runs are never cached
+        if not self.config.cache_output or self.config.gitlogs:
+            self._write_document(project_info, out)
+            return
+
+        cache = OutputCache()
+        fingerprint = cache.fingerprint(project_info, asdict(self.config))
+        markdown = cache.load(project_info, fingerprint)
+        if markdown is None:
+            buf = io.StringIO()
+            self._write_document(project_info, buf)
+            markdown = buf.getvalue()
+            cache.store(project_info, fingerprint, markdown)
+        out.write(markdown)
+
+    def _write_document(self, project_info: ProjectInfo, out: TextIO) -> None:
+        """Generate the full document into out."""
+        self._content_cache = {}
+        self._token_counts = {}
+        if self.config.use_file_cache:
+            self._file_cache = FileCache(project_info.root)
+        try:
+            self._write_sections(project_info, out)
+            if self._file_cache is not None:
+                self._file_cache.prune(f.relative_path for f in project_info.files)
+                self._file_cache.save()
+        finally:
+            # Contents are only shared within one run; don't keep them alive
+            self._content_cache = {}
+            self._token_counts = {}
+            self._file_cache = None
+
+    def _write_sections(self, project_info: ProjectInfo, out: TextIO) -> None:
+        """Write all sections, separated by blank lines, to out."""
+        # Each section is written as soon as it is built, followed by its
+        # blank-line separator, so no joined copy of them is ever made
+        write = out.write
+        for step in self._build_pipeline():
+            section = step(project_info)
+            if section is not None:
+                write(section)
+                write("\n\n")
+
+        # File contents (Level 3 - detailed), the bulk of the output, is
+        # written file by file rather than joined into one string first
+        self._write_files_content(project_info, out)
+
+        # Git history goes last so it doesn't split the code sections
+        if self.config.gitlogs:
+            git_logs_section = self._generate_git_logs(project_info.root)
+            if git_logs_section:
+                out.write("\n\n")
+                out.write(git_logs_section)
 
     def _generate_header(self, project_info: ProjectInfo) -> str:
         """Generate header with instructions for LLM."""
         project_type_label = project_info.project_type.capitalize() if project_info.project_type != 'unknown' else 'Project'
-        return f"""# Project Context: {project_info.root.name}
-
-This document contains the complete context of the {project_type_label} project located at `{project_info.root}`.
-
-**Instructions for LLM:**
-- This is a complete codebase context for analysis, modification, or understanding
-- Files are organized by their directory structure
-- Important files are marked and prioritized
-- Use this context to understand the project architecture, dependencies, and implementation details
-- When referencing files, use the relative paths provided
-- Project type: {project_info.project_type}
-
----
-"""
+        return self.HEADER_TEMPLATE.format_map({
+            'name': project_info.root.name,
+            'label': project_type_label,
+            'root': project_info.root,
+            'type': project_info.project_type,
+        })
 
     def _generate_metadata(self, project_info: ProjectInfo) -> str:
         """Generate metadata section."""
-        metadata = ["## Project Metadata\n"]
-
-        metadata.append(f"- **Project Root:** `{project_info.root}`")
-        metadata.append(f"- **Total Files:** {len(project_info.files)}")
+        metadata = [
+            "## Project Metadata\n",
+            f"- **Project Root:** `{project_info.root}`",
+            f"- **Total Files:** {len(project_info.files)}",
+        ]
 
         if project_info.python_version:
             metadata.append(f"- **Python Version:** {project_info.python_version}")
@@ -124,87 +775,79 @@ This document contains the complete context of the {project_type_label} project
         if project_info.project_type and project_info.project_type != 'unknown':
             metadata.append(f"- **Project Type:** {project_info.project_type}")
 
-        # Count by language
-        lang_counts = {}
-        for file_info in project_info.files:
-            lang_counts[file_info.language] = lang_counts.get(file_info.language, 0) + 1
+        # Count by language (most_common keeps first-seen order for ties)
+        lang_counts = Counter(map(attrgetter('language'), project_info.files))
 
         if lang_counts:
             metadata.append("\n**Files by Language:**")
-            for lang, count in sorted(lang_counts.items(), key=lambda x: x[1], reverse=True):
-                metadata.append(f"  - {lang}: {count} files")
+            metadata.extend([f"  - {lang}: {count} files"
+                             for lang, count in lang_counts.most_common()])
 
         return "\n".join(metadata)
 
     def _generate_structure(self, project_info: ProjectInfo) -> str:
         """Generate project structure tree."""
-        lines = ["## Project Structure\n"]
-        lines.append("```")
-        lines.append(self._build_tree(project_info.structure, project_info.root.name))
-        lines.append("```")
-        return "\n".join(lines)
+        return "\n".join([
+            "## Project Structure\n",
+            "```",
+            self._build_tree(project_info.structure, project_info.root.name),
+            "```",
+        ])
 
     def _build_tree(self, structure: Dict[str, List[str]], root_name: str) -> str:
         """Build a tree representation of the project structure."""
-        lines = [root_name + "/"]
-
-        # Organize structure by directory depth
-        dirs_by_depth = {}
-        for directory in structure.keys():
-            if directory == '/':
-                depth = 0
-            else:
-                depth = len(Path(directory).parts)
-            if depth not in dirs_by_depth:
-                dirs_by_depth[depth] = []
-            dirs_by_depth[depth].append(directory)
-
-        # Sort directories at each depth
-        for depth in sorted(dirs_by_depth.keys()):
-            dirs_by_depth[depth].sort()
-
-        # Build tree recursively
-        def add_directory(dir_path: str, prefix: str, is_last: bool):
-            """Add directory and its contents to tree."""
+        # Pre-size the output: one line per directory and per file, plus the root
+        est = 1 + len(structure) + sum(len(v) for v in structure.values())
+        lines: List[Optional[str]] = [None] * est
+        lines[0] = root_name + "/"
+        idx = 1
+
+        # Index directory names and parent -> children once, so each
+        # directory below is a constant-time lookup instead of a scan
+        names: Dict[str, str] = {}
+        children_of: Dict[str, List[str]] = defaultdict(list)
+        for d in structure:
+            if d == '/':
+                continue
+            parent, names[d] = os.path.split(d.rstrip('/'))
+            children_of[parent or '/'].append(d)
+
+        # Walk depth-first with an explicit stack of (dir, prefix, is_last);
+        # subdirectories are pushed in reverse so they pop in sorted order
+        stack: List[Tuple[str, str, bool]] = [('/', '', True)]
+        while stack:
+            dir_path, prefix, is_last = stack.pop()
             if dir_path == '/':
-                dir_name = root_name
                 files = structure.get('/', [])
+                new_prefix = ""
             else:
-                dir_name = Path(dir_path).name
                 files = [f for f in structure.get(dir_path, [])
-                        if str(Path(f).parent) == dir_path or (dir_path == '/' and str(Path(f).parent) == '.')]
-
-            # Add directory line (skip root)
-            if dir_path != '/':
-                lines.append(prefix + ("└── " if is_last else "├── ") + dir_name + "/")
+                        if os.path.dirname(f) == dir_path]
+                lines[idx] = "".join((prefix, "└── " if is_last else "├── ", names[dir_path], "/"))
+                idx += 1
                 new_prefix = prefix + ("    " if is_last else "│   ")
-            else:
-                new_prefix = ""
 
             # Add files in this directory
             sorted_files = sorted(set(files))
+            last = len(sorted_files) - 1
             for j, file_path in enumerate(sorted_files):
-                file_is_last = j == len(sorted_files) - 1
-                file_name = Path(file_path).name
-                file_prefix = new_prefix + ("└── " if file_is_last else "├── ")
-                lines.append(file_prefix + file_name)
+                lines[idx] = "".join((new_prefix, "└── " if j == last else "├── ",
+                                      os.path.basename(file_path)))
+                idx += 1
 
-            # Add subdirectories
-            if dir_path == '/':
-                subdirs = [d for d in structure.keys() if d != '/' and len(Path(d).parts) == 1]
-            else:
-                subdirs = [d for d in structure.keys()
-                          if d != '/' and str(Path(d).parent) == dir_path]
+            # Queue subdirectories
+            subdirs = sorted(children_of.get(dir_path, ()))
+            last = len(subdirs) - 1
+            for k in range(last, -1, -1):
+                stack.append((subdirs[k], new_prefix, k == last))
 
-            subdirs.sort()
-            for k, subdir in enumerate(subdirs):
-                subdir_is_last = k == len(subdirs) - 1
-                add_directory(subdir, new_prefix, subdir_is_last)
+        return "\n".join(lines[:idx])
 
-        # Start with root
-        add_directory('/', '', True)
-
-        return "\n".join(lines)
+    def _generate_dependencies_if_any(self, project_info: ProjectInfo) -> Optional[str]:
+        """Generate the dependencies section, or None when there are none."""
+        if not project_info.dependencies:
+            return None
+        return self._generate_dependencies(project_info)
 
     def _generate_dependencies(self, project_info: ProjectInfo) -> str:
         """Generate dependencies section."""
@@ -255,15 +898,16 @@ This document contains the complete context of the {project_type_label} project
         if entry_point:
             lines.append(f"- **🚪 Entry Point:** `{entry_point.relative_path}`")
 
-        # Core business logic files (high priority, large files)
-        core_files = [f for f in project_info.files
-                     if f.is_important and f.language == 'python'
-                     and f.priority >= 10 and f.lines > 50]
-        core_files.sort(key=lambda x: (x.priority, x.lines), reverse=True)
+        # Core business logic files (high priority, large files); the
+        # files are already ranked, so stop at the first five matches
+        core_files = list(islice(
+            (f for f in self._files_by_importance(project_info)
+             if f.is_important and f.language == 'python'
+             and f.priority >= 10 and f.lines > 50), 5))
 
         if core_files:
             lines.append("\n- **💼 Core Business Logic:**")
-            for f in core_files[:5]:  # Top 5
+            for f in core_files:
                 importance = self._get_importance_stars(f)
                 lines.append(f"  - {importance} `{f.relative_path}` ({f.lines} lines)")
 
@@ -275,7 +919,7 @@ This document contains the complete context of the {project_type_label} project
                 lines.append(f"  - {dep}")
 
         # Most complex component
-        complex_file = max(project_info.files, key=lambda f: f.lines) if project_info.files else None
+        complex_file = self._most_complex_file(project_info)
         if complex_file and complex_file.lines > 200:
             lines.append(f"\n- **⚙️ Most Complex Component:** `{complex_file.relative_path}` ({complex_file.lines} lines)")
 
@@ -285,35 +929,20 @@ This document contains the complete context of the {project_type_label} project
         """Generate thematic grouping of components (Level 2)."""
         lines = ["## 🧩 Key Components by Functionality\n"]
 
-        # Group files by functionality/themes
-        themes = self._group_by_themes(project_info.files)
-
-        theme_icons = {
-            'authentication': '🔐',
-            'api': '🌐',
-            'database': '💾',
-            'websocket': '🔌',
-            'chat': '💬',
-            'config': '⚙️',
-            'utils': '🛠️',
-            'tests': '🧪',
-            'main': '🚀',
-        }
+        # Group files by functionality/themes; grouping keeps the input
+        # order, so every theme comes out sorted by importance
+        themes = self._group_by_themes(self._files_by_importance(project_info))
 
         for theme, files in themes.items():
-            if not files:
-                continue
-
-            icon = theme_icons.get(theme, '📁')
+            icon = self.THEME_ICONS.get(theme, '📁')
             lines.append(f"\n### {icon} {theme.capitalize()}")
 
-            # Sort by importance
-            files.sort(key=lambda f: (f.priority, f.lines), reverse=True)
-
             for file_info in files[:10]:  # Top 10 per theme
                 importance = self._get_importance_stars(file_info)
-                lines.append(f"- {importance} **`{file_info.relative_path}`**")
-                lines.append(f"  - *{file_info.lines} lines | {file_info.language}*")
+                lines.extend((
+                    f"- {importance} **`{file_info.relative_path}`**",
+                    f"  - *{file_info.lines} lines | {file_info.language}*",
+                ))
 
                 # Add context if important
                 if file_info.is_important and file_info.lines > 100:
@@ -323,32 +952,79 @@ This document contains the complete context of the {project_type_label} project
 
         return "\n".join(lines)
 
+    def _files_by_importance(self, project_info: ProjectInfo) -> List[FileInfo]:
+        """Return the project files by descending (priority, lines), computed once."""
+        return self._cached_section('by_importance', project_info, self._sort_by_importance)
+
+    def _sort_by_importance(self, project_info: ProjectInfo) -> List[FileInfo]:
+        """Sort files by importance using plain tuple keys."""
+        files = project_info.files
+        # Negated keys plus the index sort with C tuple comparisons and keep
+        # equal files in their original order, like a stable reverse sort
+        keys = sorted([(-f.priority, -f.lines, i) for i, f in enumerate(files)])
+        return [files[i] for _, _, i in keys]
+
+    def _most_complex_file(self, project_info: ProjectInfo) -> Optional[FileInfo]:
+        """Return the file with the most lines (computed once per project)."""
+        return self._cached_section('most_complex', project_info, self._find_longest_file)
+
+    def _find_longest_file(self, project_info: ProjectInfo) -> Optional[FileInfo]:
+        """Return the first file with the most lines, or None if there are no files."""
+        return max(project_info.files, key=attrgetter('lines'), default=None)
+
     def _get_importance_stars(self, file_info: FileInfo) -> str:
         """Get importance stars representation."""
-        if file_info.priority >= 15:
-            return "⭐⭐⭐"
-        elif file_info.priority >= 10:
-            return "⭐⭐"
-        elif file_info.is_important:
-            return "⭐"
-        else:
-            return "⬜"
+        return _importance_stars(file_info.priority, file_info.is_important)
+
+    def _project_signals(self, project_info: ProjectInfo) -> _ProjectSignals:
+        """Return the detector flags for a project, scanning its files once."""
+        return self._cached_section('signals', project_info, self._scan_project)
+
+    def _scan_project(self, project_info: ProjectInfo) -> _ProjectSignals:
+        """Collect everything the detectors need in one pass over the files."""
+        signals = _ProjectSignals()
+        entry_points = ('main.py', 'app.py', 'run.py', '__main__.py')
+        dirs = []
+
+        for f in project_info.files:
+            path = str(f.path)
+            path_lower = path.lower()
+            name = os.path.basename(f.relative_path)
+
+            if 'fastapi' in path or 'main.py' in path:
+                signals.has_fastapi_or_main = True
+            if 'websocket' in path_lower:
+                signals.has_websocket = True
+            if 'django' in path_lower:
+                signals.has_django = True
+            if 'flask' in path_lower:
+                signals.has_flask = True
+            if 'test' in path_lower:
+                signals.has_test = True
+            if os.path.basename(path_lower) == 'manage.py':
+                signals.has_manage_py = True
+            if signals.named_entry_point is None and name in entry_points:
+                signals.named_entry_point = f
+            dirs.append(os.path.dirname(f.relative_path))
+
+        signals.dirs_lower = ' '.join(dirs).lower()
+        return signals
 
     def _detect_project_type(self, project_info: ProjectInfo) -> str:
         """Detect project type from structure."""
-        file_names = [f.path.name.lower() for f in project_info.files]
+        signals = self._project_signals(project_info)
 
-        if any('fastapi' in str(f.path) or 'main.py' in str(f.path) for f in project_info.files):
-            if any('websocket' in str(f.path).lower() for f in project_info.files):
+        if signals.has_fastapi_or_main:
+            if signals.has_websocket:
                 return "FastAPI WebSocket Application"
             return "FastAPI Application"
-        elif any('django' in str(f.path).lower() for f in project_info.files):
+        elif signals.has_django:
             return "Django Application"
-        elif any('flask' in str(f.path).lower() for f in project_info.files):
+        elif signals.has_flask:
             return "Flask Application"
-        elif 'manage.py' in file_names:
+        elif signals.has_manage_py:
             return "Django Project"
-        elif any('test' in str(f.path).lower() for f in project_info.files):
+        elif signals.has_test:
             return "Python Project with Tests"
         else:
             return "Python Application"
@@ -377,38 +1053,43 @@ This document contains the complete context of the {project_type_label} project
         return key_tech[:5]  # Top 5
 
     def _find_entry_point(self, project_info: ProjectInfo) -> Optional[FileInfo]:
-        """Find main entry point of the project."""
-        entry_points = ['main.py', 'app.py', 'run.py', '__main__.py']
+        """Find main entry point of the project (computed once per project)."""
+        return self._cached_section('entry_point', project_info, self._locate_entry_point)
 
-        for file_info in project_info.files:
-            if file_info.path.name in entry_points:
-                return file_info
+    def _locate_entry_point(self, project_info: ProjectInfo) -> Optional[FileInfo]:
+        """Search the project files for its main entry point."""
+        named = self._project_signals(project_info).named_entry_point
+        if named is not None:
+            return named
 
         # Look for files with 'if __name__ == "__main__"'
         for file_info in sorted(project_info.files, key=lambda f: f.priority, reverse=True):
             if file_info.language == 'python' and file_info.lines > 10:
+                # The analyzer records the guard while counting lines
+                if file_info.has_main_guard is not None:
+                    if file_info.has_main_guard:
+                        return file_info
+                    continue
                 try:
-                    with open(file_info.path, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                        if '__name__' in content and '__main__' in content:
-                            return file_info
+                    content = self._read_file(file_info)
                 except Exception:
-                    pass
+                    continue
+                if '__name__' in content and '__main__' in content:
+                    return file_info
 
         return None
 
     def _detect_architecture_pattern(self, project_info: ProjectInfo) -> Optional[str]:
         """Detect architecture pattern."""
-        dirs = [str(Path(f.relative_path).parent) for f in project_info.files]
-        dirs_str = ' '.join(dirs).lower()
+        dirs_str = self._project_signals(project_info).dirs_lower
 
         if 'mvc' in dirs_str or ('model' in dirs_str and 'view' in dirs_str):
             return "MVC"
-        elif 'service' in dirs_str or 'services' in dirs_str:
+        elif 'service' in dirs_str:  # also matches 'services'
             return "Service Layer"
         elif 'repository' in dirs_str:
             return "Repository Pattern"
-        elif 'handler' in dirs_str or 'handlers' in dirs_str:
+        elif 'handler' in dirs_str:  # also matches 'handlers'
             return "Handler Pattern"
 
         return None
@@ -445,28 +1126,18 @@ This document contains the complete context of the {project_type_label} project
 
         for file_info in files:
             path_lower = file_info.relative_path.lower()
-            name_lower = file_info.path.name.lower()
-
-            if 'auth' in path_lower or 'login' in path_lower or 'jwt' in path_lower:
-                themes['authentication'].append(file_info)
-            elif 'api' in path_lower or 'router' in path_lower or 'route' in path_lower:
-                themes['api'].append(file_info)
-            elif 'db' in path_lower or 'database' in path_lower or 'model' in path_lower or 'schema' in path_lower:
-                themes['database'].append(file_info)
-            elif 'websocket' in path_lower or 'ws' in path_lower:
-                themes['websocket'].append(file_info)
-            elif 'chat' in path_lower or 'message' in path_lower:
-                themes['chat'].append(file_info)
-            elif 'config' in name_lower or 'setting' in name_lower:
-                themes['config'].append(file_info)
-            elif 'util' in path_lower or 'helper' in path_lower or 'common' in path_lower:
-                themes['utils'].append(file_info)
-            elif 'test' in path_lower:
-                themes['tests'].append(file_info)
-            elif name_lower in ['main.py', 'app.py', 'run.py']:
-                themes['main'].append(file_info)
-            else:
-                themes['other'].append(file_info)
+            name_lower = os.path.basename(path_lower)
+
+            theme = min((m.lastgroup for m in _THEME_RE.finditer(path_lower)),
+                        key=_THEME_RANK.__getitem__, default=None)
+
+            # Config is decided by file name and ranks between chat and utils
+            if theme in ('utils', 'tests', None) and ('config' in name_lower or 'setting' in name_lower):
+                theme = 'config'
+            elif theme is None:
+                theme = 'main' if name_lower in ['main.py', 'app.py', 'run.py'] else 'other'
+
+            themes[theme].append(file_info)
 
         # Remove empty themes
         return {k: v for k, v in themes.items() if v}
@@ -474,59 +1145,141 @@ This document contains the complete context of the {project_type_label} project
     def _get_file_context(self, file_info: FileInfo) -> str:
         """Get context/purpose of a file by analyzing its content."""
         try:
-            with open(file_info.path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read(1000)  # Read first 1000 chars
-
-            # Look for docstrings or comments
-            if '"""' in content or "'''" in content:
-                # Try to extract docstring
-                docstring_match = re.search(r'"""(.*?)"""', content, re.DOTALL)
-                if docstring_match:
-                    doc = docstring_match.group(1).strip()
-                    if len(doc) < 200:
-                        return doc.split('\n')[0]
-
-            # Look for class/function names
-            if 'class ' in content:
-                class_match = re.search(r'class\s+(\w+)', content)
-                if class_match:
-                    return f"Class: {class_match.group(1)}"
-
-            if 'def ' in content:
-                func_match = re.search(r'def\s+(\w+)', content)
-                if func_match:
-                    return f"Function: {func_match.group(1)}"
+            content = self._read_file(file_info)
         except Exception:
-            pass
-
-        return ""
+            return ""
+        return _describe_file_head(content[:1000])
 
-    def _generate_files_content(self, project_info: ProjectInfo) -> str:
-        """Generate file contents section."""
-        lines = ["## File Contents\n"]
+    def _write_files_content(self, project_info: ProjectInfo, out: TextIO) -> None:
+        """Write the file contents section to out."""
+        write = out.write
+        write("## File Contents\n")
 
-        # Filter and sort files
+        # Filter and sort files; blocks are written as they are rendered
         files_to_include = self._select_files(project_info.files)
+        rendered = self._render_files(files_to_include)
 
         current_dir = None
-        for file_info in files_to_include:
-            file_dir = str(Path(file_info.relative_path).parent)
-            if file_dir == '.':
-                file_dir = '/'
+        for file_info, file_content in zip(files_to_include, rendered):
+            file_dir = os.path.dirname(file_info.relative_path) or '/'
 
             # Add directory header if changed
             if file_dir != current_dir:
                 if current_dir is not None:
-                    lines.append("")  # Empty line between directories
-                lines.append(f"### Directory: `{file_dir}`\n")
+                    write("\n")  # Empty line between directories
+                write(f"\n### Directory: `{file_dir}`\n")
                 current_dir = file_dir
 
             # Add file content
-            file_content = self._generate_file_content(file_info)
-            lines.append(file_content)
-            lines.append(self.config.file_separator)
-
-        return "\n".join(lines)
+            write("\n")
+            write(file_content)
+            write("\n")
+            write(self.config.file_separator)
+
+    def _render_files(self, files: List[FileInfo]) -> Iterator[str]:
+        """Render the markdown block of every file, yielding them in order.
+
+        Blocks found in the persistent file cache are reused; only the
+        remaining files are read, stripped and rendered. Each block is
+        yielded as soon as it is ready, and a file's text leaves the
+        content cache once its block exists.
+        """
+        cache = self._file_cache
+        cached: List[Optional[str]] = [None] * len(files)
+        stamps: List[Optional[Stamp]] = [None] * len(files)
+        if cache is not None:
+            for i, file_info in enumerate(files):
+                try:
+                    stamps[i] = file_stamp(file_info.path)
+                    cached[i] = cache.get(file_info.relative_path, stamps[i],
+                                          self._render_key(file_info),
+                                          functools.partial(self._content_digest, file_info))
+                except OSError:
+                    pass
+                if cached[i] is not None:
+                    # Read only to compare digests; the block is all that's needed
+                    self._content_cache.pop(str(file_info.path), None)
+
+        rendered = self._render_misses([f for f, block in zip(files, cached) if block is None])
+        for file_info, stamp, block in zip(files, stamps, cached):
+            if block is None:
+                block, digest = next(rendered)
+                # An unreadable file has no digest: its error block is not worth caching
+                if cache is not None and stamp is not None and digest is not None:
+                    cache.put(file_info.relative_path, stamp, self._render_key(file_info),
+                              digest, block)
+            yield block
+
+    def _render_misses(self, files: List[FileInfo]) -> Iterator[Tuple[str, Optional[str]]]:
+        """Render files as (block, content digest) pairs, in order, as they complete.
+
+        Workers in a process pool read the files themselves, so only the
+        rendered blocks are sent back. If the pool fails, the files it
+        didn't get to are rendered in threads. The digest is None for
+        files that couldn't be read.
+        """
+        done = 0
+        if self._use_process_pool(len(files)):
+            workers = os.cpu_count() or 1
+            render = functools.partial(_render_chunk_from_disk,
+                                       include_comments=self.config.include_comments)
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    for results in _map_in_order(pool, render, self._chunks_for_processes(files),
+                                                 self.RENDER_WINDOW_PER_WORKER * workers):
+                        for result in results:
+                            yield result
+                            done += 1
+                return
+            except Exception as e:
+                print(f"Warning: parallel rendering failed ({e!r}), using threads", file=sys.stderr)
+
+        # Rendering is dominated by file reads, so overlap them in threads;
+        # results come back in file order
+        workers = min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            yield from _map_in_order(pool, self._render_and_release, files[done:],
+                                     self.RENDER_WINDOW_PER_WORKER * workers)
+
+    def _chunks_for_processes(self, files: List[FileInfo]) -> Iterator[List[FileInfo]]:
+        """Split files into worker-sized chunks, releasing their cached texts.
+
+        Workers read the files from disk themselves, so texts read earlier
+        in the run (for token counting) are dropped as each chunk is sent.
+        """
+        chunk_size = self.PROCESS_RENDER_CHUNK
+        for start in range(0, len(files), chunk_size):
+            chunk = files[start:start + chunk_size]
+            for file_info in chunk:
+                self._content_cache.pop(str(file_info.path), None)
+            yield chunk
+
+    def _use_process_pool(self, file_count: int) -> bool:
+        """Whether rendering file_count files is worth starting worker processes.
+
+        Only comment stripping is CPU-bound enough to repay it; plain
+        rendering is I/O-bound and stays on threads.
+        """
+        return (not self.config.include_comments and (os.cpu_count() or 1) > 1
+                and file_count >= self.PARALLEL_RENDER_MIN_FILES)
+
+    def _render_and_release(self, file_info: FileInfo) -> Tuple[str, Optional[str]]:
+        """Thread worker: render a file, digest it for the file cache, drop its text."""
+        block = self._generate_file_content(file_info)
+        content = self._content_cache.pop(str(file_info.path), None)
+        digest = None
+        if content is not None and self._file_cache is not None:
+            digest = content_digest(content.encode('utf-8', 'surrogatepass'))
+        return block, digest
+
+    def _render_key(self, file_info: FileInfo) -> Tuple:
+        """Everything besides the file content that a rendered block depends on."""
+        return (file_info.language, file_info.lines, file_info.priority,
+                file_info.is_important, self.config.include_comments)
+
+    def _content_digest(self, file_info: FileInfo) -> str:
+        """Digest of a file's text, read through the per-run content cache."""
+        return content_digest(self._read_file(file_info).encode('utf-8', 'surrogatepass'))
 
     def _select_files(self, files: List[FileInfo]) -> List[FileInfo]:
         """Select which files to include based on configuration."""
@@ -538,7 +1291,7 @@ This document contains the complete context of the {project_type_label} project
             specified_paths = [Path(f).as_posix() for f in self.config.files_to_analyze]
             files_to_include = [
                 f for f in files
-                if f.relative_path in specified_paths or str(f.path.name) in specified_paths
+                if f.relative_path in specified_paths or os.path.basename(f.relative_path) in specified_paths
             ]
 
             # Если не найдено файлов - вернуть все (или выдать предупреждение)
@@ -550,103 +1303,125 @@ This document contains the complete context of the {project_type_label} project
             return self._apply_general_limits(files_to_include)
 
         # Separate important and regular files
-        important_files = [f for f in files if f.is_important]
-        regular_files = [f for f in files if not f.is_important]
+        important_files, regular_files = _partition_by_importance(files)
+
+        # Config limits are read once, outside the loop
+        max_files = self.config.max_files
+        max_file_size = self.config.max_file_size
+        max_tokens = self.config.max_tokens
+        compress_large_files = self.config.compress_large_files
+
+        if max_tokens:
+            self._count_important_tokens(important_files)
 
         # First, add important files (up to limit)
         for file_info in important_files:
             # Skip if max files reached
-            if self.config.max_files and len(selected) >= self.config.max_files:
+            if max_files and len(selected) >= max_files:
                 break
 
             # Skip if file too large (unless we can compress)
-            if self.config.max_file_size and file_info.size > self.config.max_file_size:
-                if not self.config.compress_large_files:
+            if max_file_size and file_info.size > max_file_size:
+                if not compress_large_files:
                     continue
 
-            # Estimate tokens for this file
-            file_tokens = self._estimate_file_tokens(file_info)
-
-            # Check token limit
-            if self.config.max_tokens:
-                if total_tokens + file_tokens > self.config.max_tokens:
+            # Check token limit (token counts only matter under a budget)
+            if max_tokens:
+                file_tokens = self._estimate_file_tokens(file_info)
+                if total_tokens + file_tokens > max_tokens:
                     # If important and compress enabled, include anyway (will be compressed)
-                    if self.config.compress_large_files:
+                    if compress_large_files:
                         selected.append(file_info)
                         total_tokens += file_tokens // 3  # Compressed files use ~1/3 tokens
                     continue
                 else:
                     total_tokens += file_tokens
-            else:
-                total_tokens += file_tokens
 
             selected.append(file_info)
 
         # Then add regular files if we have space
-        for file_info in regular_files:
-            # Skip if max files reached
-            if self.config.max_files and len(selected) >= self.config.max_files:
-                break
-
-            # Skip if file too large
-            if self.config.max_file_size and file_info.size > self.config.max_file_size:
-                continue
-
-            # Estimate tokens for this file
-            file_tokens = self._estimate_file_tokens(file_info)
+        selected.extend(self._fit_regular_files(regular_files, len(selected), total_tokens))
+        return selected
 
-            # Check token limit
-            if self.config.max_tokens:
-                if total_tokens + file_tokens > self.config.max_tokens:
+    def _count_important_tokens(self, files: List[FileInfo]) -> None:
+        """Tokenize the important files that may be selected, in one batch."""
+        max_file_size = self.config.max_file_size
+        if max_file_size and not self.config.compress_large_files:
+            files = [f for f in files if f.size <= max_file_size]
+        if self.config.max_files:
+            files = files[:self.config.max_files]
+        self._count_tokens(files)
+
+    def _fit_regular_files(self, files: List[FileInfo], already_selected: int,
+                           total_tokens: int) -> List[FileInfo]:
+        """Take regular files in order until max_files or max_tokens is hit.
+
+        Oversized files are skipped. The token budget is applied chunk by
+        chunk, with a running total and a binary search per chunk, so files
+        past the point where the budget runs out are never tokenized.
+        """
+        if self.config.max_file_size:
+            files = [f for f in files if f.size <= self.config.max_file_size]
+
+        count = len(files)
+        if self.config.max_files:
+            count = min(count, max(self.config.max_files - already_selected, 0))
+
+        max_tokens = self.config.max_tokens
+        if max_tokens and count:
+            taken = 0
+            chunk_size = self.TOKEN_COUNT_CHUNK
+            while taken < count:
+                chunk = files[taken:min(taken + chunk_size, count)]
+                self._count_tokens(chunk)
+                # running[k] is the token total after taking the first k files of the chunk
+                running = list(accumulate(map(self._estimate_file_tokens, chunk),
+                                          initial=total_tokens))
+                fits = max(bisect_right(running, max_tokens) - 1, 0)
+                taken += fits
+                if fits < len(chunk):
                     break
+                total_tokens = running[-1]
+                chunk_size *= 2
+            count = taken
 
-            selected.append(file_info)
-            total_tokens += file_tokens
-
-        return selected
+        return files[:count]
 
     def _estimate_file_tokens(self, file_info: FileInfo) -> int:
         """Estimate token count for a file."""
+        if _token_encoding() is not None:
+            # Exact counts are memoized for the rest of the run
+            key = str(file_info.path)
+            if key not in self._token_counts:
+                self._count_tokens([file_info])
+            count = self._token_counts.get(key)
+            if count is not None:
+                return count
         # Rough estimate: size in bytes * tokens_per_char
         return int(file_info.size * self.TOKENS_PER_CHAR)
 
+    def _count_tokens(self, files: List[FileInfo]) -> None:
+        """Tokenize files not counted yet in one batch, if tiktoken is available."""
+        encoding = _token_encoding()
+        if encoding is None:
+            return
+        keys, texts = [], []
+        for file_info in files:
+            key = str(file_info.path)
+            if key in self._token_counts:
+                continue
+            try:
+                texts.append(self._read_file(file_info))
+            except Exception:
+                continue  # Unreadable: keep the size-based estimate
+            keys.append(key)
+        if texts:
+            encoded = encoding.encode_batch(texts, disallowed_special=())
+            self._token_counts.update(zip(keys, map(len, encoded)))
+
     def _generate_file_content(self, file_info: FileInfo) -> str:
         """Generate markdown representation of a file."""
-        lines = []
-
-        # File header with improved importance system
-        importance_stars = self._get_importance_stars(file_info)
-        lines.append(f"#### {importance_stars} File: `{file_info.relative_path}`")
-        lines.append(f"*Language: {file_info.language} | Lines: {file_info.lines} | Size: {file_info.size} bytes*")
-
-        # Add context for important files
-        if file_info.is_important and file_info.lines > 50:
-            context = self._get_file_context(file_info)
-            if context:
-                lines.append(f"*Purpose: {context}*")
-
-        lines.append("")
-
-        # Read and process file content
-        try:
-            with open(file_info.path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-
-            # Always include full file content - no compression or truncation
-            # Remove comments if requested
-            if not self.config.include_comments:
-                content = self._remove_comments(content, file_info.language)
-
-            # Add code block
-            lang_tag = file_info.language if file_info.language != 'unknown' else ''
-            lines.append(f"```{lang_tag}")
-            lines.append(content)
-            lines.append("```")
-
-        except Exception as e:
-            lines.append(f"*Error reading file: {str(e)}*")
-
-        return "\n".join(lines)
+        return _render_file_block(file_info, self.config.include_comments, self._read_file)
 
     def _compress_file_content(self, content: str, file_info: FileInfo) -> str:
         """Compress large file content by showing structure and key parts."""
@@ -654,28 +1429,23 @@ This document contains the complete context of the {project_type_label} project
 
         # Language-specific compression
         if file_info.language == 'python':
-            return self._compress_python_file(lines)
-        elif file_info.language in ['javascript', 'typescript']:
-            return self._compress_js_file(lines, file_info.language)
-        elif file_info.language == 'java':
-            return self._compress_java_file(lines)
-        elif file_info.language == 'go':
-            return self._compress_go_file(lines)
-        elif file_info.language == 'rust':
-            return self._compress_rust_file(lines)
+            return self._compress_python_file(content, lines)
+        elif file_info.language in _STRUCTURE_SPECS:
+            return self._compress_structured(lines, _STRUCTURE_SPECS[file_info.language])
         else:
             # Generic compression for other languages
             if len(lines) > 100:
-                return '\n'.join(lines[:50]) + f"\n\n... (truncated, showing first 50 of {len(lines)} lines) ...\n\n" + '\n'.join(lines[-50:])
+                return '\n'.join((*lines[:50], f"\n... (truncated, showing first 50 of {len(lines)} lines) ...\n",
+                                  *lines[-50:]))
             return content
 
-    def _compress_python_file(self, lines: List[str]) -> str:
+    def _compress_python_file(self, content: str, lines: List[str]) -> str:
         """Compress Python file by extracting structure."""
         compressed = []
         compressed.append("# File structure and key components:\n")
 
         # Extract imports
-        imports = [line for line in lines if line.strip().startswith(('import ', 'from '))]
+        imports = _PY_IMPORT_LINE_RE.findall(content)
         if imports:
             compressed.append("## Imports:")
             compressed.extend(imports[:20])
@@ -686,446 +1456,100 @@ This document contains the complete context of the {project_type_label} project
         # Extract class and function definitions
         definitions = []
         indent_level = 0
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            if stripped.startswith(('class ', 'def ', 'async def ')):
-                indent = len(line) - len(line.lstrip())
-                if indent <= indent_level + 4:
-                    definitions.append((i, line, indent))
-                    indent_level = indent
+        i = pos = 0
+        for match in _PY_DEF_LINE_RE.finditer(content):
+            # Line number by counting newlines since the previous match
+            i += content.count('\n', pos, match.start())
+            pos = match.start()
+            indent = len(match.group(1))
+            if indent <= indent_level + 4:
+                definitions.append((i, match.group(0), indent))
+                indent_level = indent
 
         if definitions:
             compressed.append("## Key Definitions:")
             for idx, (line_num, def_line, indent) in enumerate(definitions[:30]):
                 compressed.append(def_line)
-                for j in range(line_num + 1, min(line_num + 5, len(lines))):
-                    if lines[j].strip():
-                        compressed.append(lines[j])
-                        if not lines[j].strip().startswith(('"""', "'''", '#')):
+                for following in lines[line_num + 1:line_num + 5]:
+                    stripped = following.strip()
+                    if stripped:
+                        compressed.append(following)
+                        if not stripped.startswith(('"""', "'''", '#')):
                             break
                 compressed.append("")
 
             if len(definitions) > 30:
                 compressed.append(f"# ... and {len(definitions) - 30} more definitions")
 
+        # Head and tail lines go straight into the final join
         compressed.append("\n# Full file content (truncated):")
-        compressed.append("".join(lines[:50]))
+        compressed.extend(islice(lines, 50))
         compressed.append("\n... (middle section omitted) ...\n")
-        compressed.append("".join(lines[-50:]))
+        compressed.extend(lines[-50:])
 
         return '\n'.join(compressed)
 
-    def _compress_js_file(self, lines: List[str], lang: str) -> str:
-        """Compress JavaScript/TypeScript file by extracting structure."""
-        compressed = []
-        compressed.append(f"# File structure and key components ({lang}):\n")
+    def _compress_structured(self, lines: List[str], spec: _StructureSpec) -> str:
+        """Compress a file by extracting imports and definitions as described by spec."""
+        compressed = [spec.header]
 
-        # Extract imports
+        # Extract imports and definitions in one pass, stripping each line once
         imports = []
-        for line in lines:
-            stripped = line.strip()
-            if stripped.startswith(('import ', 'export ', 'require(')) or 'from ' in stripped:
-                imports.append(line)
-
-        if imports:
-            compressed.append("## Imports/Exports:")
-            compressed.extend(imports[:20])
-            if len(imports) > 20:
-                compressed.append(f"// ... and {len(imports) - 20} more imports")
-            compressed.append("")
-
-        # Extract function/class definitions
-        definitions = []
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            # Match: function, class, const/let/var with function, export function/class
-            if re.match(r'^\s*(export\s+)?(async\s+)?(function|class|const|let|var)\s+\w+', stripped):
-                definitions.append((i, line))
-
-        if definitions:
-            compressed.append("## Key Definitions:")
-            for line_num, def_line in definitions[:30]:
-                compressed.append(def_line)
-                # Include a few lines after
-                for j in range(line_num + 1, min(line_num + 5, len(lines))):
-                    if lines[j].strip():
-                        compressed.append(lines[j])
-                        if not lines[j].strip().startswith(('//', '/*', '*')):
-                            break
-                compressed.append("")
-
-            if len(definitions) > 30:
-                compressed.append(f"// ... and {len(definitions) - 30} more definitions")
-
-        compressed.append("\n// Full file content (truncated):")
-        compressed.append("".join(lines[:50]))
-        compressed.append("\n// ... (middle section omitted) ...\n")
-        compressed.append("".join(lines[-50:]))
-
-        return '\n'.join(compressed)
-
-    def _compress_java_file(self, lines: List[str]) -> str:
-        """Compress Java file by extracting structure."""
-        compressed = []
-        compressed.append("# File structure and key components (Java):\n")
-
-        # Extract imports
-        imports = [line for line in lines if line.strip().startswith('import ')]
-        if imports:
-            compressed.append("## Imports:")
-            compressed.extend(imports[:20])
-            if len(imports) > 20:
-                compressed.append(f"// ... and {len(imports) - 20} more imports")
-            compressed.append("")
-
-        # Extract class/method definitions
         definitions = []
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            if re.match(r'^\s*(public|private|protected)?\s*(static)?\s*(class|interface|enum|@?\w+\s+(class|interface))', stripped):
-                definitions.append((i, line))
-            elif re.match(r'^\s*(public|private|protected)?\s*(static)?\s*\w+\s+\w+\s*\(', stripped):
-                definitions.append((i, line))
-
-        if definitions:
-            compressed.append("## Key Definitions:")
-            for line_num, def_line in definitions[:30]:
-                compressed.append(def_line)
-                for j in range(line_num + 1, min(line_num + 5, len(lines))):
-                    if lines[j].strip():
-                        compressed.append(lines[j])
-                        if not lines[j].strip().startswith(('//', '/*', '*')):
-                            break
-                compressed.append("")
-
-            if len(definitions) > 30:
-                compressed.append(f"// ... and {len(definitions) - 30} more definitions")
-
-        compressed.append("\n// Full file content (truncated):")
-        compressed.append("".join(lines[:50]))
-        compressed.append("\n// ... (middle section omitted) ...\n")
-        compressed.append("".join(lines[-50:]))
-
-        return '\n'.join(compressed)
-
-    def _compress_go_file(self, lines: List[str]) -> str:
-        """Compress Go file by extracting structure."""
-        compressed = []
-        compressed.append("// File structure and key components (Go):\n")
-
-        # Extract imports
-        imports = []
         in_import_block = False
-        for line in lines:
+        import_prefixes, import_infix = spec.import_prefixes, spec.import_infix
+        matchers = [pattern.match for pattern in spec.definitions]
+        for i, line in enumerate(lines):
             stripped = line.strip()
-            if stripped.startswith('import '):
+            if stripped.startswith(import_prefixes) or (
+                    import_infix is not None and import_infix in stripped):
                 imports.append(line)
-                in_import_block = True
+                in_import_block = spec.import_blocks
             elif in_import_block:
                 imports.append(line)
                 if stripped == ')' or (stripped and not stripped.startswith('"')):
                     in_import_block = False
 
-        if imports:
-            compressed.append("## Imports:")
-            compressed.extend(imports[:20])
-            if len(imports) > 20:
-                compressed.append(f"// ... and {len(imports) - 20} more imports")
-            compressed.append("")
-
-        # Extract function/type definitions
-        definitions = []
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            if re.match(r'^\s*(func|type|const|var)\s+\w+', stripped):
-                definitions.append((i, line))
-
-        if definitions:
-            compressed.append("## Key Definitions:")
-            for line_num, def_line in definitions[:30]:
-                compressed.append(def_line)
-                for j in range(line_num + 1, min(line_num + 5, len(lines))):
-                    if lines[j].strip():
-                        compressed.append(lines[j])
-                        if not lines[j].strip().startswith('//'):
-                            break
-                compressed.append("")
-
-            if len(definitions) > 30:
-                compressed.append(f"// ... and {len(definitions) - 30} more definitions")
-
-        compressed.append("\n// Full file content (truncated):")
-        compressed.append("".join(lines[:50]))
-        compressed.append("\n// ... (middle section omitted) ...\n")
-        compressed.append("".join(lines[-50:]))
-
-        return '\n'.join(compressed)
-
-    def _compress_rust_file(self, lines: List[str]) -> str:
-        """Compress Rust file by extracting structure."""
-        compressed = []
-        compressed.append("// File structure and key components (Rust):\n")
+            # A line can be both (e.g. `export function`), so this isn't an elif
+            for match in matchers:
+                if match(stripped):
+                    definitions.append((i, line))
+                    break
 
-        # Extract imports
-        imports = [line for line in lines if line.strip().startswith(('use ', 'mod '))]
         if imports:
-            compressed.append("## Imports/Modules:")
+            compressed.append(spec.imports_heading)
             compressed.extend(imports[:20])
             if len(imports) > 20:
                 compressed.append(f"// ... and {len(imports) - 20} more imports")
             compressed.append("")
 
-        # Extract function/struct/enum definitions
-        definitions = []
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            if re.match(r'^\s*(pub\s+)?(fn|struct|enum|trait|impl|mod|const|static)\s+\w+', stripped):
-                definitions.append((i, line))
-
         if definitions:
             compressed.append("## Key Definitions:")
             for line_num, def_line in definitions[:30]:
                 compressed.append(def_line)
-                for j in range(line_num + 1, min(line_num + 5, len(lines))):
-                    if lines[j].strip():
-                        compressed.append(lines[j])
-                        if not lines[j].strip().startswith('//'):
+                # Include a few lines after
+                for following in lines[line_num + 1:line_num + 5]:
+                    stripped = following.strip()
+                    if stripped:
+                        compressed.append(following)
+                        if not stripped.startswith(spec.doc_prefixes):
                             break
                 compressed.append("")
 
             if len(definitions) > 30:
                 compressed.append(f"// ... and {len(definitions) - 30} more definitions")
 
+        # Head and tail lines go straight into the final join
         compressed.append("\n// Full file content (truncated):")
-        compressed.append("".join(lines[:50]))
+        compressed.extend(islice(lines, 50))
         compressed.append("\n// ... (middle section omitted) ...\n")
-        compressed.append("".join(lines[-50:]))
+        compressed.extend(lines[-50:])
 
         return '\n'.join(compressed)
 
     def _remove_comments(self, content: str, language: str) -> str:
         """Remove comments from code based on language."""
-        if language == 'python':
-            return self._remove_python_comments(content)
-        elif language in ['javascript', 'typescript']:
-            return self._remove_js_comments(content)
-        elif language in ['java', 'c', 'cpp', 'csharp', 'go', 'rust']:
-            return self._remove_cstyle_comments(content)
-        elif language == 'ruby':
-            return self._remove_ruby_comments(content)
-        elif language == 'shell':
-            return self._remove_shell_comments(content)
-        else:
-            # Generic: try to remove # and // comments
-            return self._remove_generic_comments(content)
-
-    def _remove_python_comments(self, content: str) -> str:
-        """Remove Python comments from code."""
-        lines = content.split('\n')
-        cleaned = []
-        in_multiline = False
-        multiline_char = None
-
-        for line in lines:
-            # Handle multiline strings/comments
-            if '"""' in line or "'''" in line:
-                if not in_multiline:
-                    multiline_char = '"""' if '"""' in line else "'''"
-                    in_multiline = True
-                elif multiline_char in line:
-                    in_multiline = False
-                    multiline_char = None
-                cleaned.append(line)
-                continue
-
-            if in_multiline:
-                cleaned.append(line)
-                continue
-
-            # Remove inline comments
-            if '#' in line:
-                in_string = False
-                quote_char = None
-                for i, char in enumerate(line):
-                    if char in ('"', "'") and (i == 0 or line[i-1] != '\\'):
-                        if not in_string:
-                            in_string = True
-                            quote_char = char
-                        elif char == quote_char:
-                            in_string = False
-                            quote_char = None
-                    elif char == '#' and not in_string:
-                        line = line[:i]
-                        break
-                cleaned.append(line)
-            else:
-                cleaned.append(line)
-
-        return '\n'.join(cleaned)
-
-    def _remove_js_comments(self, content: str) -> str:
-        """Remove JavaScript/TypeScript comments."""
-        lines = content.split('\n')
-        cleaned = []
-        in_multiline = False
-
-        for line in lines:
-            if '/*' in line:
-                in_multiline = True
-                # Check if it closes on same line
-                if '*/' in line:
-                    # Remove the comment part
-                    parts = line.split('/*', 1)
-                    if len(parts) > 1:
-                        comment_part = parts[1].split('*/', 1)
-                        if len(comment_part) > 1:
-                            line = parts[0] + comment_part[1]
-                            in_multiline = False
-                        else:
-                            line = parts[0]
-                    else:
-                        line = ''
-                else:
-                    line = line.split('/*', 1)[0]
-
-            if in_multiline:
-                if '*/' in line:
-                    line = line.split('*/', 1)[1]
-                    in_multiline = False
-                else:
-                    line = ''
-
-            # Remove single-line comments
-            if '//' in line:
-                # Check if // is in a string
-                in_string = False
-                quote_char = None
-                for i, char in enumerate(line):
-                    if char in ('"', "'", '`') and (i == 0 or line[i-1] != '\\'):
-                        if not in_string:
-                            in_string = True
-                            quote_char = char
-                        elif char == quote_char:
-                            in_string = False
-                            quote_char = None
-                    elif i < len(line) - 1 and line[i:i+2] == '//' and not in_string:
-                        line = line[:i]
-                        break
-
-            if line or not in_multiline:
-                cleaned.append(line)
-
-        return '\n'.join(cleaned)
-
-    def _remove_cstyle_comments(self, content: str) -> str:
-        """Remove C-style comments (// and /* */)."""
-        lines = content.split('\n')
-        cleaned = []
-        in_multiline = False
-
-        for line in lines:
-            if '/*' in line:
-                in_multiline = True
-                if '*/' in line:
-                    parts = line.split('/*', 1)
-                    if len(parts) > 1:
-                        comment_part = parts[1].split('*/', 1)
-                        if len(comment_part) > 1:
-                            line = parts[0] + comment_part[1]
-                            in_multiline = False
-                        else:
-                            line = parts[0]
-                    else:
-                        line = ''
-                else:
-                    line = line.split('/*', 1)[0]
-
-            if in_multiline:
-                if '*/' in line:
-                    line = line.split('*/', 1)[1]
-                    in_multiline = False
-                else:
-                    line = ''
-
-            # Remove single-line comments
-            if '//' in line:
-                line = line.split('//', 1)[0].rstrip()
-
-            if line or not in_multiline:
-                cleaned.append(line)
-
-        return '\n'.join(cleaned)
-
-    def _remove_ruby_comments(self, content: str) -> str:
-        """Remove Ruby comments."""
-        lines = content.split('\n')
-        cleaned = []
-
-        for line in lines:
-            # Remove inline comments (but not in strings)
-            if '#' in line:
-                in_string = False
-                quote_char = None
-                for i, char in enumerate(line):
-                    if char in ('"', "'") and (i == 0 or line[i-1] != '\\'):
-                        if not in_string:
-                            in_string = True
-                            quote_char = char
-                        elif char == quote_char:
-                            in_string = False
-                            quote_char = None
-                    elif char == '#' and not in_string:
-                        line = line[:i]
-                        break
-            cleaned.append(line)
-
-        return '\n'.join(cleaned)
-
-    def _remove_shell_comments(self, content: str) -> str:
-        """Remove shell script comments."""
-        lines = content.split('\n')
-        cleaned = []
-
-        for line in lines:
-            stripped = line.lstrip()
-            # Remove comments, but preserve shebang
-            if stripped.startswith('#'):
-                if not stripped.startswith('#!'):
-                    line = ''
-            elif '#' in line:
-                # Remove inline comments (but not in strings)
-                in_string = False
-                quote_char = None
-                for i, char in enumerate(line):
-                    if char in ('"', "'") and (i == 0 or line[i-1] != '\\'):
-                        if not in_string:
-                            in_string = True
-                            quote_char = char
-                        elif char == quote_char:
-                            in_string = False
-                            quote_char = None
-                    elif char == '#' and not in_string:
-                        line = line[:i]
-                        break
-            cleaned.append(line)
-
-        return '\n'.join(cleaned)
-
-    def _remove_generic_comments(self, content: str) -> str:
-        """Generic comment removal for unknown languages."""
-        lines = content.split('\n')
-        cleaned = []
-
-        for line in lines:
-            # Try to remove # comments
-            if '#' in line:
-                line = line.split('#', 1)[0].rstrip()
-            # Try to remove // comments
-            if '//' in line:
-                line = line.split('//', 1)[0].rstrip()
-            cleaned.append(line)
-
-        return '\n'.join(cleaned)
+        return _remove_comments(content, language)
 
     def _apply_general_limits(self, files: List[FileInfo]) -> List[FileInfo]:
         """Apply general limits (max_files, max_tokens, etc.) to a list of files."""
@@ -1133,49 +1557,40 @@ This document contains the complete context of the {project_type_label} project
         total_tokens = 0
 
         # Separate important and regular files
-        important_files = [f for f in files if f.is_important]
-        regular_files = [f for f in files if not f.is_important]
+        important_files, regular_files = _partition_by_importance(files)
+
+        max_files = self.config.max_files
+        max_file_size = self.config.max_file_size
+        max_tokens = self.config.max_tokens
+        compress_large_files = self.config.compress_large_files
+
+        if max_tokens:
+            self._count_important_tokens(important_files)
 
         # Process important files first
         for file_info in important_files:
-            if self.config.max_files and len(selected) >= self.config.max_files:
+            if max_files and len(selected) >= max_files:
                 break
 
-            if self.config.max_file_size and file_info.size > self.config.max_file_size:
-                if not self.config.compress_large_files:
+            if max_file_size and file_info.size > max_file_size:
+                if not compress_large_files:
                     continue
 
-            file_tokens = self._estimate_file_tokens(file_info)
-
-            if self.config.max_tokens:
-                if total_tokens + file_tokens > self.config.max_tokens:
-                    if self.config.compress_large_files:
+            if max_tokens:
+                file_tokens = self._estimate_file_tokens(file_info)
+                if total_tokens + file_tokens > max_tokens:
+                    if compress_large_files:
                         selected.append(file_info)
                         total_tokens += file_tokens // 3
                         continue
                     else:
                         break
+                total_tokens += file_tokens
 
             selected.append(file_info)
-            total_tokens += file_tokens
 
         # Process regular files if space remains
-        for file_info in regular_files:
-            if self.config.max_files and len(selected) >= self.config.max_files:
-                break
-
-            if self.config.max_file_size and file_info.size > self.config.max_file_size:
-                continue
-
-            file_tokens = self._estimate_file_tokens(file_info)
-
-            if self.config.max_tokens:
-                if total_tokens + file_tokens > self.config.max_tokens:
-                    break
-
-            selected.append(file_info)
-            total_tokens += file_tokens
-
+        selected.extend(self._fit_regular_files(regular_files, len(selected), total_tokens))
         return selected
     
 
@@ -1184,61 +1599,100 @@ This document contains the complete context of the {project_type_label} project
         if not self.config.gitlogs or self.config.gitlogs <= 0:
             return ""
         
+        # Получаем хеши и заголовки последних коммитов одним вызовом
+        cmd = [
+            'git', '-C', str(project_root),
+            'log', f'-{self.config.gitlogs}', '--no-merges',
+            '--pretty=format:%H %h - %ad - %s', '--date=short'
+        ]
         try:
             # Проверяем есть ли git репозиторий
             if not (project_root / '.git').exists():
                 return ""
+            result = subprocess.run(cmd, capture_output=True, encoding='utf-8', errors='replace',
+                                    timeout=10)
+        except _GIT_ERRORS:
+            return ""
+        
+        if result.returncode != 0:
+            return ""
+        
+        commits = [line.split(' ', 1) for line in result.stdout.strip().split('\n') if line]
+        if not commits:
+            return ""
+        
+        # A failure here only loses the diffs; the commit titles are still listed
+        details = self._fetch_commit_details(project_root, [h for h, _ in commits])
+        
+        sections = ["## 🔄 Recent Git Commit Changes\n"]
+        
+        for hash, commit_title in commits:
+            sections.append(f"### Commit: {commit_title.strip()}\n")
             
-            # Получаем хеши последних коммитов
-            cmd = [
-                'git', '-C', str(project_root),
-                'log', f'-{self.config.gitlogs}',
-                '--pretty=format:%H', '--no-merges'
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            
-            if result.returncode != 0:
-                return ""
-            
-            commit_hashes = result.stdout.strip().split('\n')
-            if not commit_hashes or commit_hashes[0] == '':
-                return ""
-            
-            sections = ["## 🔄 Recent Git Commit Changes\n"]
-            
-            # Для каждого коммита получаем детали изменений
-            for hash in commit_hashes:
-                # Получаем заголовок коммита
-                title_cmd = [
-                    'git', '-C', str(project_root),
-                    'log', '-1', '--pretty=format:%h - %ad - %s', '--date=short', hash
-                ]
-                title_result = subprocess.run(title_cmd, capture_output=True, text=True, timeout=5)
-                
-                if title_result.returncode != 0:
-                    continue
-                
-                commit_title = title_result.stdout.strip()
-                sections.append(f"### Commit: {commit_title}\n")
-                
-                # Получаем детали изменений
-                show_cmd = [
-                    'git', '-C', str(project_root),
-                    'show', '--stat', '--patch', hash
-                ]
-                show_result = subprocess.run(show_cmd, capture_output=True, text=True, timeout=15)
-                
-                if show_result.returncode != 0:
-                    sections.append("```\nError retrieving commit details\n```")
-                    continue
-                
-                diff_output = show_result.stdout.strip()
-                if diff_output:
-                    sections.append("```diff")
-                    sections.append(diff_output[:2000] + "..." if len(diff_output) > 2000 else diff_output)
-                    sections.append("```")
+            diff_output = details.get(hash)
+            if diff_output is None:
+                sections.append("```\nError retrieving commit details\n```")
+                continue
             
-            return "\n".join(sections)
+            diff_output = diff_output.strip()
+            if diff_output:
+                sections.append("```diff")
+                limit = self.GIT_DIFF_PREVIEW_CHARS
+                sections.append(diff_output[:limit] + "..." if len(diff_output) > limit else diff_output)
+                sections.append("```")
         
-        except (subprocess.SubprocessError, OSError, Exception):
-            return ""
+        return "\n".join(sections)
+
+    def _fetch_commit_details(self, project_root: Path, hashes: List[str]) -> Dict[str, str]:
+        """Return the `git show --stat --patch` text of each commit (possibly cut short).
+
+        Commits whose details could not be read are missing from the result;
+        if git fails or times out partway, the ones before are still returned.
+        """
+        # Детали всех коммитов одним вызовом: `git log -p --stat`
+        # печатает каждый коммит так же, как `git show --stat --patch`
+        log_cmd = [
+            'git', '-C', str(project_root),
+            'log', f'-{self.config.gitlogs}', '--no-merges', '--stat', '--patch',
+            # Pinned, so user config (format.pretty, color.ui) can't hide the
+            # `commit <hash>` lines the output is split on
+            '--pretty=medium', '--no-color',
+        ]
+        timeout = self.GIT_DETAILS_TIMEOUT + self.GIT_DETAILS_TIMEOUT_PER_COMMIT * len(hashes)
+        timed_out = threading.Event()
+        details: Dict[str, str] = {}
+
+        def expire() -> None:
+            timed_out.set()
+            _kill_process_group(proc)
+
+        try:
+            # Streamed, so a huge diff is never held in memory past its preview
+            # Diffs may hold any bytes; a stray one must not lose every commit
+            with subprocess.Popen(log_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                  encoding='utf-8', errors='replace',
+                                  start_new_session=True) as proc:
+                # The deadline covers the reading, not just the final wait:
+                # killing git ends the stream, so a hung git can't block us
+                deadline = threading.Timer(timeout, expire)
+                deadline.daemon = True
+                deadline.start()
+                try:
+                    _collect_commit_log(proc.stdout, hashes, self.GIT_DIFF_PREVIEW_CHARS, details)
+                    if len(details) == len(hashes) and proc.poll() is None:
+                        _kill_process_group(proc)  # Stopped early; the rest isn't needed
+                    proc.stdout.close()
+                    returncode = proc.wait()
+                finally:
+                    deadline.cancel()
+        except _GIT_ERRORS:
+            # Only commits followed by the next header are in details yet,
+            # so everything there is complete
+            return details
+        if (timed_out.is_set() or returncode != 0) and details:
+            # git died or was killed mid-stream: unless its preview was already
+            # full, the last commit may be cut short
+            last = next(reversed(details))
+            if len(details[last].rstrip()) <= self.GIT_DIFF_PREVIEW_CHARS:
+                del details[last]
+        return details
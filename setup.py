@@ -1,50 +0,0 @@
-"""
-Setup script for CMforAI package.
-"""
-
-from setuptools import setup, find_packages
-from pathlib import Path
-
-# Read README
-readme_file = Path(__file__).parent / "README.md"
-long_description = readme_file.read_text(encoding="utf-8") if readme_file.exists() else ""
-
-# Read requirements
-requirements_file = Path(__file__).parent / "requirements.txt"
-requirements = []
-if requirements_file.exists():
-    requirements = [
-        line.strip()
-        for line in requirements_file.read_text(encoding="utf-8").splitlines()
-        if line.strip() and not line.startswith("#")
-    ]
-
-setup(
-    name="cmforai",
-    version="0.1.0",
-    description="Context Manager for LLMs - Extract and format project context",
-    long_description=long_description,
-    long_description_content_type="text/markdown",
-    author="kurtatter",
-    license="MIT",
-    packages=find_packages(),
-    install_requires=requirements,
-    python_requires=">=3.8",
-    entry_points={
-        "console_scripts": [
-            "cmforai=cmforai.cli:main",
-        ],
-    },
-    classifiers=[
-        "Development Status :: 3 - Alpha",
-        "Intended Audience :: Developers",
-        "License :: OSI Approved :: MIT License",
-        "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.8",
-        "Programming Language :: Python :: 3.9",
-        "Programming Language :: Python :: 3.10",
-        "Programming Language :: Python :: 3.11",
-        "Programming Language :: Python :: 3.12",
-    ],
-)
-
@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+from cmforai.analyzer import ProjectAnalyzer
+from cmforai.cache import FileCache, OutputCache, file_stamp
+
+KEY = ('python', 3, 0, False, True)
+
+
+def _digest_of(text):
+    calls = []
+
+    def digest():
+        calls.append(text)
+        return text
+    return digest, calls
+
+
+@pytest.fixture
+def settled(monkeypatch):
+    """Treat files written during the test as settled (ctime can't be backdated)."""
+    monkeypatch.setattr(FileCache, 'SETTLE_NS', -60 * 10**9)
+
+
+def test_round_trip_and_render_key(tmp_path, settled):
+    src = tmp_path / 'a.py'
+    src.write_text('print(1)\n')
+    cache = FileCache(tmp_path, cache_dir=tmp_path / 'cache')
+    cache.put('a.py', file_stamp(src), KEY, 'd1', 'BLOCK')
+    cache.save()
+
+    cache = FileCache(tmp_path, cache_dir=tmp_path / 'cache')
+    digest, calls = _digest_of('d1')
+    assert cache.get('a.py', file_stamp(src), KEY, digest) == 'BLOCK'
+    assert cache.get('a.py', file_stamp(src), KEY[:-1] + (False,), digest) is None
+    assert cache.get('b.py', file_stamp(src), KEY, digest) is None
+    assert calls == []
+
+
+def test_changed_content_invalidates(tmp_path):
+    src = tmp_path / 'a.py'
+    src.write_text('print(1)\n')
+    cache = FileCache(tmp_path, cache_dir=tmp_path / 'cache')
+    cache.put('a.py', file_stamp(src), KEY, 'd1', 'BLOCK')
+
+    src.write_text('print(2)\n')
+    digest, calls = _digest_of('d2')
+    assert cache.get('a.py', file_stamp(src), KEY, digest) is None
+    assert calls == ['d2']
+
+
+def test_recent_stamp_is_checked_by_content(tmp_path):
+    src = tmp_path / 'a.py'
+    src.write_text('print(1)\n')
+    cache = FileCache(tmp_path, cache_dir=tmp_path / 'cache')
+    stamp = file_stamp(src)
+    cache.put('a.py', stamp, KEY, 'd1', 'BLOCK')
+
+    # Same stamp, but the file was written moments ago: a second write in
+    # the same clock tick would not show, so the digest has to be compared
+    digest, calls = _digest_of('d2')
+    assert cache.get('a.py', stamp, KEY, digest) is None
+    assert calls == ['d2']
+    digest, calls = _digest_of('d1')
+    assert cache.get('a.py', stamp, KEY, digest) == 'BLOCK'
+
+
+def test_size_change_skips_digest(tmp_path):
+    src = tmp_path / 'a.py'
+    src.write_text('print(1)\n')
+    cache = FileCache(tmp_path, cache_dir=tmp_path / 'cache')
+    cache.put('a.py', file_stamp(src), KEY, 'd1', 'BLOCK')
+    src.write_text('print(10)\n')
+    digest, calls = _digest_of('d1')
+    assert cache.get('a.py', file_stamp(src), KEY, digest) is None
+    assert calls == []
+
+
+def test_prune(tmp_path, settled):
+    src = tmp_path / 'a.py'
+    src.write_text('x\n')
+    cache = FileCache(tmp_path, cache_dir=tmp_path / 'cache')
+    cache.put('a.py', file_stamp(src), KEY, 'd', 'A')
+    cache.put('gone.py', file_stamp(src), KEY, 'd', 'B')
+    cache.prune(['a.py'])
+    cache.save()
+    cache = FileCache(tmp_path, cache_dir=tmp_path / 'cache')
+    digest, _ = _digest_of('d')
+    assert cache.get('gone.py', file_stamp(src), KEY, digest) is None
+    assert cache.get('a.py', file_stamp(src), KEY, digest) == 'A'
+
+
+def test_corrupt_cache_file_is_ignored(tmp_path):
+    src = tmp_path / 'a.py'
+    src.write_text('x\n')
+    cache = FileCache(tmp_path, cache_dir=tmp_path / 'cache')
+    cache.path.parent.mkdir(parents=True)
+    digest, _ = _digest_of('d')
+    for garbage in ('{not json', '[]', '{"format": 2}', '{"format": 2, "version": "%s", '
+                    '"entries": {"a.py": [1, 2]}}' % __import__('cmforai').__version__):
+        cache.path.write_text(garbage)
+        cache = FileCache(tmp_path, cache_dir=tmp_path / 'cache')
+        assert cache.get('a.py', file_stamp(src), KEY, digest) is None
+    # And it still saves over the corrupt file
+    cache.put('a.py', file_stamp(src), KEY, 'd', 'A')
+    cache.save()
+    assert FileCache(tmp_path, cache_dir=tmp_path / 'cache').get(
+        'a.py', file_stamp(src), KEY, digest) == 'A'
+
+
+def test_output_cache_invalidation(tmp_path):
+    project = tmp_path / 'project'
+    project.mkdir()
+    src = project / 'a.py'
+    src.write_text('x = 1\n')
+    cache = OutputCache(tmp_path / 'cache')
+    info = ProjectAnalyzer(str(project)).analyze()
+    fingerprint = cache.fingerprint(info, {'max_files': None})
+    cache.store(info, fingerprint, '# doc\n')
+    assert cache.load(info, fingerprint) == '# doc\n'
+
+    # Another config, or a file rewritten with its size and mtime kept
+    assert cache.fingerprint(info, {'max_files': 5}) != fingerprint
+    st = os.stat(src)
+    src.write_text('x = 2\n')
+    os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns))
+    changed = cache.fingerprint(ProjectAnalyzer(str(project)).analyze(), {'max_files': None})
+    assert changed != fingerprint
+    assert cache.load(info, changed) is None
+
+
+def test_output_cache_corrupt_file(tmp_path):
+    project = tmp_path / 'project'
+    project.mkdir()
+    info = ProjectAnalyzer(str(project)).analyze()
+    cache = OutputCache(tmp_path / 'cache')
+    fingerprint = cache.fingerprint(info, {})
+    cache.store(info, fingerprint, 'doc')
+    entry = cache._entry_path(info)
+    entry.write_bytes(b'\xff\xfe not utf-8')
+    assert cache.load(info, fingerprint) is None
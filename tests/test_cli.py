@@ -0,0 +1,51 @@
+import sys
+
+import pytest
+
+from cmforai import cli
+from cmforai.generator import MarkdownGenerator
+
+
+@pytest.fixture
+def run_cli(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    project = tmp_path / 'project'
+    project.mkdir()
+    (project / 'main.py').write_text('print("hi")\n')
+
+    def run(*args):
+        monkeypatch.setattr(sys, 'argv', ['cmforai', str(project), *args])
+        cli.main()
+    return run
+
+
+def test_output_file_is_replaced(run_cli, tmp_path):
+    out = tmp_path / 'context.md'
+    out.write_text('previous')
+    run_cli('-o', str(out))
+    assert 'print("hi")' in out.read_text()
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith('.tmp')] == []
+
+
+def test_failed_run_keeps_previous_output(run_cli, tmp_path, monkeypatch):
+    out = tmp_path / 'context.md'
+    out.write_text('previous')
+
+    def fail(self, project_info, stream):
+        stream.write('partial')
+        raise RuntimeError('boom')
+    monkeypatch.setattr(MarkdownGenerator, 'generate_to', fail)
+    with pytest.raises(SystemExit):
+        run_cli('-o', str(out))
+    assert out.read_text() == 'previous'
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith('.tmp')] == []
+
+
+def test_replaced_output_keeps_its_mode(run_cli, tmp_path):
+    out = tmp_path / 'context.md'
+    out.write_text('previous')
+    out.chmod(0o640)
+    run_cli('-o', str(out))
+    assert 'print("hi")' in out.read_text()
+    assert out.stat().st_mode & 0o777 == 0o640
@@ -0,0 +1,113 @@
+from cmforai.generator import _remove_comments
+
+
+def test_python_keeps_hash_in_strings():
+    source = 'x = "a # b"  # note\ny = \'#\'\n'
+    assert _remove_comments(source, 'python') == 'x = "a # b"  \ny = \'#\'\n'
+
+
+def test_python_prefixed_strings():
+    source = "p = rb'\\d#' + f\"{x}#\" + Rb\"#\"  # tail\n"
+    assert _remove_comments(source, 'python') == "p = rb'\\d#' + f\"{x}#\" + Rb\"#\"  \n"
+
+
+def test_python_triple_quoted_strings():
+    source = 'doc = """\n# not a comment\nit\'s "quoted"\n"""  # comment\n# gone\n'
+    expected = 'doc = """\n# not a comment\nit\'s "quoted"\n"""  \n\n'
+    assert _remove_comments(source, 'python') == expected
+
+
+def test_python_unterminated_string_stops_at_newline():
+    source = "s = 'oops\n# comment\n"
+    assert _remove_comments(source, 'python') == "s = 'oops\n\n"
+
+
+def test_shell_heredoc_apostrophe():
+    source = (
+        "cat <<EOF\n"
+        "Don't run as root.\n"
+        "EOF\n"
+        "# configure\n"
+        "URL='http://host/#frag'\n"
+    )
+    expected = (
+        "cat <<EOF\n"
+        "Don't run as root.\n"
+        "EOF\n"
+        "\n"
+        "URL='http://host/#frag'\n"
+    )
+    assert _remove_comments(source, 'shell') == expected
+
+
+def test_shell_keeps_shebang_and_parameter_length():
+    source = '#!/bin/sh\necho "${#name} $#" # count\n'
+    assert _remove_comments(source, 'shell') == '#!/bin/sh\necho "${#name} $#" \n'
+
+
+def test_cstyle_keeps_slashes_in_strings_and_chars():
+    source = 'char *u = "http://x"; char c = \'/\'; // gone\nint d = \'\\\'\'; /* gone */\n'
+    expected = 'char *u = "http://x"; char c = \'/\';\nint d = \'\\\'\'; \n'
+    assert _remove_comments(source, 'c') == expected
+
+
+def test_rust_lifetimes_are_not_chars():
+    source = "fn f<'a>(s: &'a str) -> &'a str { // don't keep\n    s\n}\n"
+    expected = "fn f<'a>(s: &'a str) -> &'a str {\n    s\n}\n"
+    assert _remove_comments(source, 'rust') == expected
+
+
+def test_rust_escaped_chars():
+    source = "let c = '\\u{1F600}'; let q = '\\''; // gone\n"
+    assert _remove_comments(source, 'rust') == "let c = '\\u{1F600}'; let q = '\\'';\n"
+
+
+def test_cpp_digit_separators():
+    source = "int n = 1'000'000; // it's a million\nint m = 2'0; // x\n"
+    assert _remove_comments(source, 'cpp') == "int n = 1'000'000;\nint m = 2'0;\n"
+
+
+def test_ruby_keeps_hash_in_strings():
+    source = 'puts "a # b" # say it\nx = \'#\'  # char\n'
+    assert _remove_comments(source, 'ruby') == 'puts "a # b" \nx = \'#\'  \n'
+
+
+def test_javascript_keeps_slashes_in_strings():
+    source = (
+        "const url = 'http://x'; // link\n"
+        "const t = `a // b`; /* block */ f();\n"
+        "/* multi\n   line */\n"
+        "g(\"\\\"//\"); // escaped quote\n"
+    )
+    expected = (
+        "const url = 'http://x'; \n"
+        "const t = `a // b`;  f();\n"
+        "\n"
+        "g(\"\\\"//\"); \n"
+    )
+    assert _remove_comments(source, 'javascript') == expected
+    assert _remove_comments(source, 'typescript') == expected
+
+
+def test_go_raw_strings_and_block_comments():
+    source = 'x := `// not a comment`\n/* doc\n */\ny := "/*" // end\n'
+    assert _remove_comments(source, 'go') == 'x := `// not a comment`\n\ny := "/*"\n'
+
+
+def test_unterminated_block_comment_runs_to_end():
+    assert _remove_comments('int a; /* open\nint b;\n', 'c') == 'int a; '
+
+
+def test_generic_strips_hash_and_slash_comments():
+    source = 'key: value  # note\nother: 1 // note\nplain\n'
+    assert _remove_comments(source, 'yaml') == 'key: value\nother: 1\nplain\n'
+
+
+def test_no_markers_returns_content_unchanged():
+    source = 'x = 1\n'
+    assert _remove_comments(source, 'python') is source
+
+
+def test_shell_indented_comment_lines_become_empty():
+    source = 'f() {\n    # explain\n\t# more\n    x=1  # inline\n}\n'
+    assert _remove_comments(source, 'shell') == 'f() {\n\n\n    x=1  \n}\n'
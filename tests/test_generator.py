@@ -0,0 +1,179 @@
+import io
+import os
+import time
+
+import pytest
+
+from cmforai import generator as generator_module
+from cmforai.analyzer import ProjectAnalyzer
+from cmforai.generator import GenerationConfig, MarkdownGenerator
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / 'main.py').write_text('import os  # stdlib\n\n\ndef main():\n    return os.sep\n')
+    (tmp_path / 'pkg').mkdir()
+    for i in range(3):
+        (tmp_path / 'pkg' / f'mod{i}.py').write_text(f'X = {i}  # value\n')
+    return ProjectAnalyzer(str(tmp_path)).analyze()
+
+
+class _BrokenPool:
+    def __init__(self, *args, **kwargs):
+        raise OSError('no semaphores')
+
+
+def test_process_pool_is_only_used_for_stripping(project, monkeypatch):
+    monkeypatch.setattr(generator_module.os, 'cpu_count', lambda: 4)
+    monkeypatch.setattr(MarkdownGenerator, 'PARALLEL_RENDER_MIN_FILES', 1)
+    count = len(project.files)
+    assert not MarkdownGenerator(GenerationConfig(include_comments=True))._use_process_pool(count)
+    assert MarkdownGenerator(GenerationConfig(include_comments=False))._use_process_pool(count)
+    monkeypatch.setattr(generator_module.os, 'cpu_count', lambda: 1)
+    assert not MarkdownGenerator(GenerationConfig(include_comments=False))._use_process_pool(count)
+
+
+def test_process_pool_failure_falls_back_with_warning(project, monkeypatch, capsys):
+    expected = MarkdownGenerator(GenerationConfig(include_comments=False)).generate(project)
+    monkeypatch.setattr(generator_module, 'ProcessPoolExecutor', _BrokenPool)
+    monkeypatch.setattr(generator_module.os, 'cpu_count', lambda: 4)
+    monkeypatch.setattr(MarkdownGenerator, 'PARALLEL_RENDER_MIN_FILES', 1)
+    out = MarkdownGenerator(GenerationConfig(include_comments=False)).generate(project)
+    assert out == expected
+    assert '# value' not in out
+    assert 'parallel rendering failed' in capsys.readouterr().err
+
+
+class _CountingEncoding:
+    """Stands in for tiktoken: one token per character, recording what it saw."""
+
+    def __init__(self):
+        self.batches = []
+
+    def encode_batch(self, texts, disallowed_special=()):
+        self.batches.append(len(texts))
+        return [list(text) for text in texts]
+
+
+@pytest.fixture
+def encoding(monkeypatch):
+    fake = _CountingEncoding()
+    monkeypatch.setattr(generator_module, '_token_encoding', lambda: fake)
+    return fake
+
+
+def _many_files(tmp_path, count, size):
+    for i in range(count):
+        (tmp_path / f'm{i:03}.txt').write_text('x' * size)
+    return ProjectAnalyzer(str(tmp_path)).analyze().files
+
+
+def test_no_token_counting_without_budget(tmp_path, encoding):
+    files = _many_files(tmp_path, 40, 100)
+    selected = MarkdownGenerator(GenerationConfig(max_tokens=None))._select_files(files)
+    assert len(selected) == 40
+    assert encoding.batches == []
+
+
+def test_token_budget_counts_lazily(tmp_path, encoding):
+    files = _many_files(tmp_path, 200, 100)
+    gen = MarkdownGenerator(GenerationConfig(max_tokens=2550))
+    selected = gen._select_files(files)
+    assert len(selected) == 25
+    # Two chunks (16 + 32 files) cover the budget; the rest is never read
+    assert sum(encoding.batches) == 48
+
+
+class _SlowStream(io.StringIO):
+    """A slow writer that records, at every file block, how many blocks
+    have been rendered but not written yet and how many texts are held."""
+
+    def __init__(self, gen):
+        super().__init__()
+        self.gen = gen
+        self.rendered = 0
+        self.written = 0
+        self.in_flight = []
+        self.held = []
+
+    def write(self, text):
+        if text == self.gen.config.file_separator:
+            self.written += 1
+            self.in_flight.append(self.rendered - self.written)
+            self.held.append(len(self.gen._content_cache))
+            time.sleep(0.002)
+        return super().write(text)
+
+
+def test_generate_to_streams_blocks_and_releases_contents(tmp_path, monkeypatch):
+    _many_files(tmp_path, 120, 50)
+    project = ProjectAnalyzer(str(tmp_path)).analyze()
+    expected = MarkdownGenerator().generate(project)
+
+    gen = MarkdownGenerator()
+    stream = _SlowStream(gen)
+    render = MarkdownGenerator._render_and_release
+
+    def counting_render(self, file_info):
+        result = render(self, file_info)
+        stream.rendered += 1
+        return result
+    monkeypatch.setattr(MarkdownGenerator, '_render_and_release', counting_render)
+
+    gen.generate_to(project, stream)
+    assert stream.getvalue() == expected
+    assert stream.written == len(project.files)
+    # Only a window of renders runs ahead of the writer, whatever its speed
+    workers = min(32, (os.cpu_count() or 1) * 4)
+    window = MarkdownGenerator.RENDER_WINDOW_PER_WORKER * workers
+    assert max(stream.in_flight) <= window < len(project.files)
+    # Texts leave the content cache once rendered
+    assert max(stream.held) <= window
+    assert gen._content_cache == {}
+
+
+def test_config_changes_apply_to_every_section(project):
+    gen = MarkdownGenerator()
+    with_all = gen.generate(project)
+    gen.config.add_instructions = False
+    gen.config.include_metadata = False
+    without = gen.generate(project)
+    assert without != with_all
+    assert without == MarkdownGenerator(GenerationConfig(
+        add_instructions=False, include_metadata=False)).generate(project)
+
+
+def test_file_cache_reuses_and_invalidates_blocks(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    root = tmp_path / 'project'
+    root.mkdir()
+    (root / 'main.py').write_text('x = 1  # one\n')
+    project = ProjectAnalyzer(str(root)).analyze()
+    expected = MarkdownGenerator().generate(project)
+
+    config = GenerationConfig(use_file_cache=True)
+    assert MarkdownGenerator(config).generate(project) == expected
+    assert list((tmp_path / 'cache' / 'cmforai').glob('*.json'))
+    assert MarkdownGenerator(config).generate(project) == expected
+
+    (root / 'main.py').write_text('x = 2  # two\n')
+    project = ProjectAnalyzer(str(root)).analyze()
+    assert 'x = 2' in MarkdownGenerator(config).generate(project)
+
+
+def test_process_pool_releases_texts_read_for_token_counting(tmp_path, monkeypatch, encoding):
+    _many_files(tmp_path, 40, 50)
+    project = ProjectAnalyzer(str(tmp_path)).analyze()
+    config = GenerationConfig(include_comments=False, max_tokens=10**6)
+    expected = MarkdownGenerator(config).generate(project)
+
+    monkeypatch.setattr(generator_module.os, 'cpu_count', lambda: 2)
+    monkeypatch.setattr(MarkdownGenerator, 'PARALLEL_RENDER_MIN_FILES', 1)
+    gen = MarkdownGenerator(config)
+    stream = _SlowStream(gen)
+    gen.generate_to(project, stream)
+    assert stream.getvalue() == expected
+    # Every file was read for its token count; the workers read their own
+    # copies, so by the last block none of those texts is still held
+    assert encoding.batches
+    assert stream.held[-1] == 0
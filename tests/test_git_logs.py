@@ -0,0 +1,188 @@
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+from cmforai.generator import GenerationConfig, MarkdownGenerator, _collect_commit_log
+
+HASH_A = 'a' * 40
+HASH_B = 'b' * 40
+
+# Recorded `git log --no-merges --stat --patch` output for two commits
+LOG_OUTPUT = f"""\
+commit {HASH_A}
+Author: Dev <dev@example.com>
+Date:   Mon Jan 1 12:00:00 2024 +0000
+
+    Fix parser
+
+    commit {HASH_B} is mentioned here but indented
+---
+ cmforai/parser.py | 2 +-
+ 1 file changed, 1 insertion(+), 1 deletion(-)
+
+diff --git a/cmforai/parser.py b/cmforai/parser.py
+--- a/cmforai/parser.py
++++ b/cmforai/parser.py
+@@ -1 +1 @@
+-x = 1
++x = 2
+commit {HASH_B}
+Author: Dev <dev@example.com>
+Date:   Sun Dec 31 12:00:00 2023 +0000
+
+    Initial commit
+
+ README.md | 1 +
+ 1 file changed, 1 insertion(+)
+"""
+
+
+def test_collect_commit_log_splits_commits():
+    details = _collect_commit_log(LOG_OUTPUT.splitlines(keepends=True), [HASH_A, HASH_B], 2000)
+    assert list(details) == [HASH_A, HASH_B]
+    assert details[HASH_A].startswith(f'commit {HASH_A}\n')
+    assert details[HASH_A].endswith('+x = 2\n')
+    assert f'    commit {HASH_B} is mentioned' in details[HASH_A]
+    assert details[HASH_B].startswith(f'commit {HASH_B}\n')
+    assert 'Initial commit' in details[HASH_B]
+
+
+def test_collect_commit_log_keeps_only_the_preview():
+    details = _collect_commit_log(LOG_OUTPUT.splitlines(keepends=True), [HASH_A, HASH_B], 40)
+    full = _collect_commit_log(LOG_OUTPUT.splitlines(keepends=True), [HASH_A, HASH_B], 2000)
+    for commit_hash in (HASH_A, HASH_B):
+        assert full[commit_hash].startswith(details[commit_hash])
+        assert details[commit_hash].strip()[:40] == full[commit_hash].strip()[:40]
+        assert len(details[commit_hash]) < len(full[commit_hash])
+
+
+def test_collect_commit_log_stops_after_last_commit():
+    lines = iter(LOG_OUTPUT.splitlines(keepends=True))
+    _collect_commit_log(lines, [HASH_A], 10)
+    # The only commit filled up on its first line, so reading stopped there
+    assert next(lines).startswith('Author:')
+
+
+@pytest.fixture
+def fake_git(tmp_path, monkeypatch):
+    """Put a scripted `git` first on PATH; returns a function to set its --stat output."""
+    if os.name != 'posix':
+        pytest.skip('needs an executable script on PATH')
+    project = tmp_path / 'project'
+    (project / '.git').mkdir(parents=True)
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (tmp_path / 'titles.txt').write_text(f'{HASH_A} aaaaaaa - 2024-01-01 - Fix parser\n'
+                                         f'{HASH_B} bbbbbbb - 2023-12-31 - Initial commit')
+
+    def install(body):
+        script = bin_dir / 'git'
+        script.write_text(textwrap.dedent(f"""\
+            #!{sys.executable}
+            import sys, time
+            if '--stat' not in sys.argv:
+                sys.stdout.write(open({str(tmp_path / 'titles.txt')!r}).read())
+                sys.exit(0)
+        """) + textwrap.dedent(body))
+        script.chmod(script.stat().st_mode | stat.S_IEXEC)
+
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+    (tmp_path / 'log.txt').write_text(LOG_OUTPUT)
+    install.project = project
+    install.log_path = tmp_path / 'log.txt'
+    return install
+
+
+def test_git_logs_section_from_recorded_output(fake_git):
+    fake_git(f"sys.stdout.write(open({str(fake_git.log_path)!r}).read())\n")
+    section = MarkdownGenerator(GenerationConfig(gitlogs=2))._generate_git_logs(fake_git.project)
+    assert '### Commit: aaaaaaa - 2024-01-01 - Fix parser' in section
+    assert '+x = 2' in section
+    assert '### Commit: bbbbbbb - 2023-12-31 - Initial commit' in section
+    assert 'Error retrieving commit details' not in section
+
+
+def test_hanging_git_falls_back_to_titles(fake_git, monkeypatch):
+    # Writes part of the first commit, then hangs with stdout still open,
+    # both itself and in a child process that inherited the pipe
+    fake_git(f"""\
+        import subprocess
+        sys.stdout.write(open({str(fake_git.log_path)!r}).read()[:200])
+        sys.stdout.flush()
+        subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+        time.sleep(60)
+    """)
+    monkeypatch.setattr(MarkdownGenerator, 'GIT_DETAILS_TIMEOUT', 1)
+    monkeypatch.setattr(MarkdownGenerator, 'GIT_DETAILS_TIMEOUT_PER_COMMIT', 0)
+    start = time.monotonic()
+    section = MarkdownGenerator(GenerationConfig(gitlogs=2))._generate_git_logs(fake_git.project)
+    assert time.monotonic() - start < 10
+    assert '### Commit: aaaaaaa - 2024-01-01 - Fix parser' in section
+    assert '### Commit: bbbbbbb - 2023-12-31 - Initial commit' in section
+    assert section.count('Error retrieving commit details') == 2
+
+
+@pytest.fixture
+def git_repo(tmp_path, monkeypatch):
+    """A real repository with two commits; returns a function running git in it."""
+    if shutil.which('git') is None:
+        pytest.skip('git is not installed')
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setenv('GIT_CONFIG_NOSYSTEM', '1')
+    for var in ('AUTHOR', 'COMMITTER'):
+        monkeypatch.setenv(f'GIT_{var}_NAME', 'Dev')
+        monkeypatch.setenv(f'GIT_{var}_EMAIL', 'dev@example.com')
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+
+    def git(*args):
+        subprocess.run(['git', '-C', str(repo), *args], check=True, capture_output=True)
+
+    git('init', '-q')
+    (repo / 'a.py').write_text('x = 1\n')
+    git('add', 'a.py')
+    git('commit', '-q', '-m', 'Add a')
+    (repo / 'a.py').write_text('x = 2\n')
+    git('commit', '-q', '-am', 'Change a')
+    git.repo = repo
+    return git
+
+
+def test_git_logs_ignore_user_format_and_color(git_repo):
+    git_repo('config', 'format.pretty', 'oneline')
+    git_repo('config', 'color.ui', 'always')
+    section = MarkdownGenerator(GenerationConfig(gitlogs=2))._generate_git_logs(git_repo.repo)
+    assert 'Error retrieving commit details' not in section
+    assert '+x = 2' in section
+    assert '+x = 1' in section
+    assert '\x1b[' not in section
+
+
+def test_non_utf8_diff_keeps_every_commit(git_repo):
+    (git_repo.repo / 'latin.txt').write_bytes('café\n'.encode('latin-1'))
+    git_repo('add', 'latin.txt')
+    git_repo('commit', '-q', '-m', 'Add latin-1 file')
+    section = MarkdownGenerator(GenerationConfig(gitlogs=3))._generate_git_logs(git_repo.repo)
+    assert 'Error retrieving commit details' not in section
+    assert '+caf�' in section
+    assert '+x = 2' in section
+    assert '+x = 1' in section
+
+
+def test_failing_git_keeps_completed_commits(fake_git):
+    # Prints all of the first commit and part of the second, then fails
+    fake_git(f"""\
+        log = open({str(fake_git.log_path)!r}).read()
+        sys.stdout.write(log[:log.index('Initial commit')])
+        sys.exit(128)
+    """)
+    section = MarkdownGenerator(GenerationConfig(gitlogs=2))._generate_git_logs(fake_git.project)
+    assert '+x = 2' in section
+    assert section.count('Error retrieving commit details') == 1
+    assert section.index('+x = 2') < section.index('Error retrieving commit details')